@@ -1,15 +1,46 @@
+import time
+LAUNCH_TIME = time.perf_counter()  # --startup-times measures from here
 import sys, os
+import csv
+import json
+import argparse
+import shutil
+import hashlib
+import functools
+import contextlib
+import math
+import mmap
+import platform
+import random
+import sqlite3
+import subprocess
+import tempfile
+import types
+import wave
+import multiprocessing
 import tkinter as tk
-from tkinter import filedialog, messagebox, Scale
-from pydub import AudioSegment
-from mutagen import File as MutagenFile
-import simpleaudio as sa
-from PIL import Image, ImageTk
+from tkinter import filedialog, messagebox, ttk, Scale
+try:
+    import sounddevice as sd
+except (ImportError, OSError):  # OSError when the PortAudio library is missing
+    sd = None
+try:
+    import simpleaudio as sa
+except ImportError:
+    sa = None
+try:
+    import resource  # Peak memory for --benchmark; Unix only
+except ImportError:
+    resource = None
+from PIL import Image, ImageColor, ImageTk
 import os
-import time
+import threading
+import weakref
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+from numpy.lib.stride_tricks import sliding_window_view
+# matplotlib, pydub and mutagen are imported where they are first used, so the window shows sooner
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 ICON_DIR = os.path.join(os.path.dirname(SCRIPT_DIR), "icons")
@@ -62,8 +93,219 @@ RIGHT_PANEL_Y = 285 # Y position for right panel (from Photoshop measurement)
 
 # also check (self.info_text) & (self.waveform_fig) for size adjustments
 
+# === Waveform Configuration ===
+PEAK_BASE_BUCKET = 32      # Samples per bucket at the finest pyramid level
+PEAK_LEVEL_FACTOR = 4      # Each coarser level merges this many buckets
+PEAK_MIN_BUCKETS = 1024    # Stop adding levels once a level is this small
+ZOOM_STEP = 1.5            # Zoom factor per mouse wheel step
+
+# === Spectrogram Configuration ===
+SPECTROGRAM_FFT_SIZE = 2048      # STFT length
+SPECTROGRAM_HOP = 1024           # Frames per column at the finest level
+SPECTROGRAM_CHUNK_COLUMNS = 256  # Columns computed per batched FFT
+SPECTROGRAM_ROWS = 256           # Log-spaced frequency rows
+SPECTROGRAM_MIN_HZ = 20
+SPECTROGRAM_MAX_HZ = 20000       # Fixed, so files at different sample rates line up row for row
+SPECTROGRAM_FLOOR_DB = -120.0    # Bottom of the 8-bit dB scale
+SPECTROGRAM_LEVEL_FACTOR = 4     # Each coarser level keeps the loudest of this many columns
+SPECTROGRAM_MIN_COLUMNS = 1024   # Stop adding levels once a level is this small
+SPECTRAL_DIFF_RANGE_DB = 20.0    # Colour scale of the spectral difference view, either way
+
+# === Loading Configuration ===
+LOADER_WORKERS = max(2, os.cpu_count() or 2)  # At least one worker per panel
+LOAD_POLL_MS = 50          # How often the UI checks on a running load
+
+# === Sources Configuration ===
+SOURCE_COUNT = 2              # Panels A, B, ...; those past B open in their own window (--sources)
+MAX_SOURCES = 8               # Keys 1-8 pick a source, so the null test stays reachable on 9
+MORE_SOURCES_COLUMNS = 3      # Panels per row in the extra sources window
+MEMORY_BUDGET_BYTES = 1024 ** 3  # Decoded audio held in process memory; more is spilled to mapped files
+PAGER_INTERVAL_MS = 1000      # How often every source is paged in around the playhead
+PAGER_BEHIND_SECONDS = 2      # Audio kept resident behind the playhead (and before a loop)
+PAGER_AHEAD_SECONDS = 15      # ...and ahead of it, so a switch to any source never waits on disk
+
+# === Cache Configuration ===
+# Decoded PCM, peaks and tags are kept on disk so reloading a file skips ffmpeg
+USE_DECODE_CACHE = True
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "audio-ab-tester")
+CACHE_MAX_BYTES = 8 * 1024 ** 3    # Least recently used entries are evicted above this
+CACHE_HASH_BYTES = 1024 * 1024     # Bytes hashed from the start and end of each file
+CACHE_VERSION = 2                  # Bump when the entry layout changes; old entries age out
+ASSET_CACHE_DIR = os.path.join(CACHE_DIR, "assets")  # Icons and background, pre-scaled, as raw pixels
+
+# === Streaming Configuration ===
+# Long files are decoded chunk by chunk straight into a memory-mapped file instead of all at once
+STREAM_MIN_SECONDS = 10 * 60  # Files at least this long are streamed
+STREAM_CHUNK_SECONDS = 1      # Decoded audio handed over per step (rounded to whole hops)
+STREAM_REDRAW_MS = 1000       # Partial waveform refresh interval while streaming
+
+SAMPLE_DTYPES = {1: np.int8, 2: np.int16, 4: np.int32}  # pydub widens 24-bit to 32-bit
+
+# === Playback Configuration ===
+PLAYBACK_BLOCK_FRAMES = 256   # Frames rendered per output callback (~5 ms at 48 kHz)
+GAIN_SMOOTHING_MS = 20        # Volume changes glide over this long to avoid zipper noise
+SIMPLEAUDIO_CHUNK_SECONDS = 5  # Audio rendered per simpleaudio buffer; bounds the cost of restarting one
+SIMPLEAUDIO_SETTLE_MS = 150   # simpleaudio picks up gain and offset changes once they stop changing this long
+
+# === Meter Configuration ===
+ENVELOPE_HOP_MS = 10          # Resolution of the precomputed level envelope
+ENVELOPE_CHUNK_HOPS = 1000    # Hops converted to float at a time while measuring
+METER_WINDOW_HOPS = 5         # Meter shows the loudest hop from the last 50 ms
+METER_FLOOR_DB = -60.0        # Level at the bottom of the LED meter
+METER_SEGMENTS = 40           # LED segments per channel bar
+METER_DECAY_DB_PER_S = 24     # Fall rate once the level drops; rises are instant
+METER_PEAK_HOLD_MS = 1500     # The highest segment stays lit this long before falling
+METER_TRUE_PEAK = False       # Also measure 4x oversampled true peak (slower to load)
+TRUE_PEAK_OVERSAMPLE = 4
+TRUE_PEAK_TAPS = 12           # Filter taps per interpolation phase
+TRUE_PEAK_CHUNK_FRAMES = 2 ** 16  # Frames oversampled at a time; larger chunks fall out of the CPU cache
+
+# === Loudness Configuration ===
+# Integrated loudness per ITU-R BS.1770 (K-weighting, 400 ms blocks, -70 LUFS and -10 LU gates)
+LOUDNESS_FFT_SIZE = 2 ** 16   # FFT length for the chunked K-weighting convolution
+K_WEIGHTING_IR_MS = 100       # K-weighting impulse response length; decays below -150 dB by then
+TRUE_PEAK_SEARCH_DB = 6.0     # Only oversample hops within this many dB of the sample peak
+MATCH_X = 390                 # Loudness match toggle, under the transport status
+MATCH_Y = 325
+
+# === Conversion Configuration ===
+# A file loaded next to one with another sample rate (or fewer channels) is converted to match it
+RESAMPLE_TAPS = 128           # Filter taps per polyphase branch (even); 20 kHz is within 1 dB
+RESAMPLE_BETA = 9.0           # Kaiser window shape; about 90 dB of stopband rejection
+RESAMPLE_ROLLOFF = 0.95       # Passband edge as a fraction of the lower Nyquist frequency
+RESAMPLE_CHUNK_FRAMES = 2 ** 16  # Output frames computed per step
+
+# === Alignment Configuration ===
+# Offsets are found on the 10 ms level envelopes, then refined sample-accurately on the PCM
+ALIGN_MAX_OFFSET_S = 10.0     # Largest offset searched between two sources
+ALIGN_REFINE_MS = 500         # Length of each full-rate refinement window
+ALIGN_POINTS = 5              # Refinement windows spread over the file; their trend gives the drift
+ALIGN_MIN_CORRELATION = 0.5   # Windows that correlate worse than this are ignored
+ALIGN_X = 500                 # Time alignment toggle, next to the loudness match toggle
+ALIGN_Y = 325
+
+# === Null Test Configuration ===
+NULL_X = 390                  # Null test toggle, under the loudness match toggle
+NULL_Y = 350
+NULL_WATCH_MS = 250           # How often the null test window updates its figures while computing or playing
+NULL_REDRAW_STEP = 0.05       # Redraw the difference waveform each time this much more is computed
+
+# === ABX Configuration ===
+ABX_TRIALS = 16               # Trials per session
+ABX_LOG_DIR = os.path.join(os.path.expanduser("~"), ".local", "share", "audio-ab-tester", "abx")
+ABX_X = 500                   # Blind ABX toggle, next to the null test toggle
+ABX_Y = 350
+
+# === Library Configuration ===
+LIBRARY_DB = os.path.join(os.path.expanduser("~"), ".local", "share", "audio-ab-tester", "library.sqlite")
+LIBRARY_VERSION = 1                   # Bump when the index layout changes; files are indexed again
+LIBRARY_EXTENSIONS = (".wav", ".mp3", ".flac", ".aiff", ".aif", ".ogg", ".oga", ".opus", ".m4a")
+LIBRARY_WORKERS = os.cpu_count() or 1 # Worker processes decoding new and changed files
+LIBRARY_COMMIT_EVERY = 50             # Files written per transaction, so searches see a scan progress
+LIBRARY_THUMB_WIDTH = 96              # Peak thumbnail columns stored per file
+LIBRARY_THUMB_HEIGHT = 20             # Thumbnail height in the picker, in pixels
+LIBRARY_SEARCH_LIMIT = 300            # Results listed at once
+LIBRARY_REFRESH_MS = 1000             # How often the results are refreshed while a scan runs
+LIBRARY_X = 390                       # Library toggle, under the null test toggle
+LIBRARY_Y = 372
+AUDIO_FILE_PATTERNS = " ".join("*" + extension for extension in LIBRARY_EXTENSIONS)  # Open dialog filter
+
+# === Playlist Configuration ===
+PLAYLIST_PREFETCH_PAIRS = 2           # Pairs prepared ahead of the one being auditioned
+PLAYLIST_MEMORY_BYTES = 512 * 1024 ** 2  # Audio held by pairs prepared ahead; the next pair is always prepared
+PLAYLIST_X = 500                      # Playlist toggle, next to the library toggle
+PLAYLIST_Y = 372
+
+# === Batch Configuration ===
+# Used by --batch, which compares the pairs in a manifest without opening a window
+BATCH_WORKERS = os.cpu_count() or 1   # Worker processes; each compares one pair at a time
+SPECTRUM_FFT_SIZE = 4096              # FFT length for the per-band spectral difference
+SPECTRUM_CHUNK_FFTS = 256             # FFTs computed per batch
+SPECTRUM_BANDS = (31.5, 63, 125, 250, 500, 1000, 2000, 4000, 8000, 16000)  # Octave band centres (Hz)
+
+# === Transport Configuration ===
+CROSSFADE_MS = 5              # Crossfade when switching sources (0 for a hard cut)
+LOOP_CROSSFADE_MS = 10        # The loop's tail blends into the audio leading up to its start
+LOOP_MIN_MS = 50              # Shorter drags on the waveform count as a click and clear the loop
+SWITCH_HOTKEY = "<space>"     # Toggles the audible source; keys 1-9 pick one directly
+SWITCH_LATENCY_HISTORY = 50   # Number of switch latency measurements kept
+STATUS_X = 390                # Transport status display, above the cassette window
+STATUS_Y = 300
+STATUS_WIDTH = 219
+
+# === Benchmark Configuration ===
+BENCHMARK_CASES = (           # (seconds, sample rate, bytes per sample) of each generated test file
+    (10, 44100, 2), (10, 96000, 4), (60, 44100, 2), (60, 48000, 3), (60, 96000, 4), (600, 44100, 2))
+BENCHMARK_CHANNELS = 2
+BENCHMARK_DRAWS = 5           # Full waveform redraws timed per file
+BENCHMARK_TICKS = 600         # Cursor and meter updates timed per file (10 s of UI at 60 fps)
+BENCHMARK_PLAYS = 10          # Playback starts timed per file
+BENCHMARK_SWITCHES = 40       # Source switches timed per file, while playing
+
+# === Frame Scheduler Configuration ===
+FRAME_INTERVAL_MS = 16        # UI tick while anything moves (~60 fps); no ticks at all otherwise
+FRAME_STATS_HISTORY = 1000    # Tick timings kept for --ui-stats
+
+@functools.lru_cache(maxsize=None)
+def matplotlib_tk():
+    """matplotlib's Figure and Tk canvas classes; imported on first use as they take longest to load"""
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+    return Figure, FigureCanvasTkAgg
+
+def scaled_image(path, size, alpha=1.0):
+    """An image file resized to `size` and faded by `alpha`, cached on disk so later launches skip the work"""
+    st = os.stat(path)
+    key = hashlib.sha1(f"{os.path.abspath(path)}|{st.st_size}|{st.st_mtime_ns}|{size}|{alpha}".encode())
+    cached = os.path.join(ASSET_CACHE_DIR, key.hexdigest() + ".npy")
+    try:
+        return Image.fromarray(np.load(cached))
+    except (OSError, ValueError):
+        pass
+
+    image = Image.open(path)
+    if image.mode not in ("L", "RGB", "RGBA"):
+        image = image.convert("RGBA")  # Palette images would lose their colours as an array
+    if image.size != tuple(size):
+        image = image.resize(size)
+    if alpha < 1.0:
+        image = image.convert("RGBA")
+        data = np.array(image)
+        data[..., 3] = data[..., 3] * alpha
+        image = Image.fromarray(data)
+    try:
+        os.makedirs(ASSET_CACHE_DIR, exist_ok=True)
+        tmp = cached + f".{os.getpid()}.tmp.npy"
+        np.save(tmp, np.asarray(image))
+        os.replace(tmp, cached)
+    except OSError:
+        pass  # An unwritable cache only costs the resize next time
+    return image
+
+@functools.lru_cache(maxsize=None)
+def load_icon(path, size):
+    """One shared PhotoImage per icon file and size"""
+    return ImageTk.PhotoImage(scaled_image(path, size))
+
+class StartupTimer:
+    """Milliseconds spent in each startup phase, printed by --startup-times"""
+    def __init__(self, start=LAUNCH_TIME):
+        self.start = start
+        self.last = start
+        self.phases = {}
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.phases[phase] = round((now - self.last) * 1000, 1)
+        self.last = now
+
+    def report(self):
+        return dict(self.phases, total=round((self.last - self.start) * 1000, 1))
+
 class LEDMeter(tk.Canvas):
-    def __init__(self, parent, width=200, height=20, segments=20, **kwargs):
+    """Segmented per-channel level meter; segments are created once and only recolored on change"""
+    def __init__(self, parent, width=200, height=20, segments=METER_SEGMENTS, channels=1,
+                 decay_db_per_s=METER_DECAY_DB_PER_S, peak_hold_ms=METER_PEAK_HOLD_MS, **kwargs):
         super().__init__(parent, width=width, height=height, highlightthickness=0, **kwargs)
         self.segments = segments
         self.width = width
@@ -73,43 +315,88 @@ class LEDMeter(tk.Canvas):
         self.segment_width = width / segments
         self.segment_padding = 1  # Space between segments
 
-        # Initialize with all segments off
-        self.level = 0
-        self.draw_segments()
+        # Ballistics work on the 0-100% scale, which is linear in dB
+        self.decay = decay_db_per_s / -METER_FLOOR_DB * 100
+        self.peak_hold = peak_hold_ms / 1000
+        self.last_update = None
 
-    def draw_segments(self):
-        """Draw the meter segments with appropriate colors"""
-        self.delete("all")  # Clear the canvas
+        # Lit and dimmed colour of every segment, worked out once
+        lit = [self.segment_color(i) for i in range(segments)]
+        self.colors = {True: lit, False: [self.dim_color(color, factor=0.3) for color in lit]}
 
-        for i in range(self.segments):
-            # Determine segment color based on position
-            if i < self.segments * 0.7:  # First 70% are green
-                color = COLOR_SCHEME["meter_green"]
-            elif i < self.segments * 0.9:  # Next 20% are yellow
-                color = COLOR_SCHEME["meter_yellow"]
-            else:  # Last 10% are red
-                color = COLOR_SCHEME["meter_red"]
-
-            # Calculate segment position
-            x1 = i * self.segment_width
-            y1 = 0
-            x2 = (i + 1) * self.segment_width - self.segment_padding
-            y2 = self.height
-
-            # Draw the segment with lower brightness if not active
-            if i < self.level:
-                self.create_rectangle(x1, y1, x2, y2, fill=color, outline="")
-            else:
-                # Create a dimmed version for inactive segments
-                dim_color = self.dim_color(color, factor=0.3)
-                self.create_rectangle(x1, y1, x2, y2, fill=dim_color, outline="")
+        self.channels = 0
+        self.set_channels(channels)
+
+    def segment_color(self, i):
+        if i < self.segments * 0.7:  # First 70% are green
+            return COLOR_SCHEME["meter_green"]
+        if i < self.segments * 0.9:  # Next 20% are yellow
+            return COLOR_SCHEME["meter_yellow"]
+        return COLOR_SCHEME["meter_red"]  # Last 10% are red
+
+    def set_channels(self, channels):
+        """Create one bar of segments per channel, all off; nothing happens if the count is unchanged"""
+        if channels == self.channels:
+            return
+        self.channels = channels
+        self.row_height = self.height / channels  # One row of segments per channel
+        self.delete("all")
+        self.items = []
+        for row in range(channels):
+            y1 = row * self.row_height
+            y2 = (row + 1) * self.row_height - (self.segment_padding if row < channels - 1 else 0)
+            self.items.append([self.create_rectangle(i * self.segment_width, y1,
+                                                     (i + 1) * self.segment_width - self.segment_padding, y2,
+                                                     fill=self.colors[False][i], outline="")
+                               for i in range(self.segments)])
+        self.lit = [[False] * self.segments for _ in range(channels)]
+        self.display = [0.0] * channels     # Shown level after ballistics (percent)
+        self.peaks = [0.0] * channels       # Held peak (percent)
+        self.peak_times = [0.0] * channels  # When each peak was last pushed up
+
+    def reset(self, channels=None):
+        """Switch every segment off at once, optionally changing the number of bars"""
+        self.set_channels(channels or self.channels)
+        self.display = [0.0] * self.channels
+        self.peaks = [0.0] * self.channels
+        self.last_update = None
+        for row in range(self.channels):
+            self.paint_row(row, 0, 0)
+
+    def set_level(self, level_percent, now=None):
+        """Set every channel to the same level (0-100%)"""
+        return self.set_levels([level_percent], now)
+
+    def set_levels(self, levels_percent, now=None):
+        """Feed per-channel levels (0-100%); a mono level is shown on every row
 
-    def set_level(self, level_percent):
-        """Set the meter level (0-100%)"""
-        level = int((self.segments * level_percent) / 100)
-        if level != self.level:
-            self.level = level
-            self.draw_segments()
+        Returns True while the bars are still falling or a peak is still held, i.e. while
+        the meter needs further updates to settle.
+        """
+        now = time.perf_counter() if now is None else now
+        elapsed = 0.0 if self.last_update is None else min(now - self.last_update, 1.0)
+        self.last_update = now
+        levels = (list(levels_percent) + list(levels_percent[-1:]) * self.channels)[:self.channels]
+        settling = False
+        for row, level in enumerate(levels):
+            shown = max(level, self.display[row] - self.decay * elapsed)
+            self.display[row] = shown
+            if shown >= self.peaks[row]:
+                self.peaks[row], self.peak_times[row] = shown, now
+            elif now - self.peak_times[row] > self.peak_hold:
+                self.peaks[row] = max(shown, self.peaks[row] - self.decay * elapsed)
+            settling = settling or shown > level or self.peaks[row] > shown
+            self.paint_row(row, int(self.segments * shown / 100), int(self.segments * self.peaks[row] / 100))
+        return settling
+
+    def paint_row(self, row, lit, peak):
+        """Recolor only the segments of one bar whose on/off state changed"""
+        states = self.lit[row]
+        for i in range(self.segments):
+            on = i < lit or i == peak - 1
+            if on != states[i]:
+                states[i] = on
+                self.itemconfig(self.items[row][i], fill=self.colors[on][i])
 
     @staticmethod
     def dim_color(hex_color, factor=0.3):
@@ -128,8 +415,9 @@ class LEDMeter(tk.Canvas):
         return f"#{r:02x}{g:02x}{b:02x}"
 
 class VolumeControl(tk.Frame):
-    def __init__(self, parent, **kwargs):
+    def __init__(self, parent, command=None, **kwargs):
         bg_color = kwargs.pop('bg', COLOR_SCHEME["background"])
+        self.command = command  # Called with the new volume (0.0 to 1.0) while dragging
         super().__init__(parent, bg=bg_color, **kwargs)
 
         # Volume slider - adjusted width for new panel size
@@ -151,9 +439,7 @@ class VolumeControl(tk.Frame):
 
         # Volume icon (you might want to use an icon here)
         try:
-            self.icon_volume = ImageTk.PhotoImage(
-                Image.open(os.path.join(SCRIPT_DIR, "icon_volume.png")).resize((24, 24))
-            )
+            self.icon_volume = load_icon(os.path.join(SCRIPT_DIR, "icon_volume.png"), (24, 24))
             self.volume_label = tk.Label(
                 self,
                 image=self.icon_volume,
@@ -192,13 +478,2304 @@ class VolumeControl(tk.Frame):
         vol = int(float(val))
         self.volume = vol / 100.0
         self.volume_value.config(text=f"{vol}%")
+        if self.command:
+            self.command(self.volume)
 
     def get_volume(self):
         """Return current volume (0.0 to 1.0)"""
         return self.volume
 
+class PeakPyramid:
+    """Min/max peaks of a signal at several zoom levels, built once per file"""
+    def __init__(self, samples, base_bucket=PEAK_BASE_BUCKET, factor=PEAK_LEVEL_FACTOR):
+        # `samples` may be mono or (frames, channels); peaks span all channels
+        self.length = len(samples)
+        self.factor = factor
+        self.levels = []  # (bucket_size, mins, maxs), finest first
+
+        mins, maxs = self.reduce(samples, samples, base_bucket)
+        bucket = base_bucket
+        self.levels.append((bucket, mins, maxs))
+
+        # Each coarser level is built from the previous one, never from the samples
+        while len(mins) > PEAK_MIN_BUCKETS:
+            mins, maxs = self.reduce(mins, maxs, factor)
+            bucket *= factor
+            self.levels.append((bucket, mins, maxs))
+
+    @classmethod
+    def empty(cls, length, base_bucket=PEAK_BASE_BUCKET, factor=PEAK_LEVEL_FACTOR):
+        """An all-zero pyramid for `length` samples, filled in piece by piece with update()"""
+        pyramid = cls.__new__(cls)
+        pyramid.length = length
+        pyramid.factor = factor
+        pyramid.levels = []
+        count, bucket = -(-length // base_bucket), base_bucket
+        while True:
+            pyramid.levels.append((bucket, np.zeros(count, np.float32), np.zeros(count, np.float32)))
+            if count <= PEAK_MIN_BUCKETS:
+                break
+            count, bucket = -(-count // factor), bucket * factor
+        return pyramid
+
+    def update(self, start, samples):
+        """Fill in the peaks of `samples` from frame `start` (a finest-bucket boundary) at every level"""
+        bucket, mins, maxs = self.levels[0]
+        first = start // bucket
+        block_min, block_max = self.reduce(samples, samples, bucket)
+        mins[first:first + len(block_min)], maxs[first:first + len(block_min)] = block_min, block_max
+        self.propagate(first, first + len(block_min))
+
+    def propagate(self, first, last):
+        """Rebuild the coarser buckets covering finest buckets [first, last) from the level below"""
+        for (_, fine_min, fine_max), (_, coarse_min, coarse_max) in zip(self.levels, self.levels[1:]):
+            first, last = first // self.factor, -(-last // self.factor)
+            span = slice(first * self.factor, last * self.factor)
+            coarse_min[first:last], coarse_max[first:last] = self.reduce(fine_min[span], fine_max[span],
+                                                                         self.factor)
+
+    def resize(self, length):
+        """Grow or trim every level to cover `length` samples, e.g. once a streamed file's length is known"""
+        self.length = length
+        self.levels = [(bucket, resized(mins, -(-length // bucket)), resized(maxs, -(-length // bucket)))
+                       for bucket, mins, maxs in self.levels]
+        while len(self.levels[-1][1]) > PEAK_MIN_BUCKETS:
+            bucket, mins, maxs = self.levels[-1]
+            self.levels.append((bucket * self.factor, *self.reduce(mins, maxs, self.factor)))
+        # The last coarse buckets may have covered frames past the new end
+        finest = len(self.levels[0][1])
+        self.propagate(max(0, finest - 1), finest)
+
+    @staticmethod
+    def reduce(mins, maxs, size):
+        """Collapse every `size` values into one min/max pair"""
+        full = len(mins) // size * size
+        width = size * (mins.shape[1] if mins.ndim == 2 else 1)
+        out_min = mins[:full].reshape(-1, width).min(axis=1)
+        out_max = maxs[:full].reshape(-1, width).max(axis=1)
+        if full < len(mins):
+            # Partial bucket at the end of the file
+            out_min = np.append(out_min, mins[full:].min())
+            out_max = np.append(out_max, maxs[full:].max())
+        return out_min.astype(np.float32), out_max.astype(np.float32)
+
+    def save(self, path):
+        """Write all levels to an .npz file"""
+        arrays = {"length": np.array(self.length), "factor": np.array(self.factor),
+                  "buckets": np.array([bucket for bucket, _, _ in self.levels])}
+        for i, (_, mins, maxs) in enumerate(self.levels):
+            arrays[f"mins{i}"] = mins
+            arrays[f"maxs{i}"] = maxs
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        """Read a pyramid written by save()"""
+        with np.load(path) as data:
+            pyramid = cls.__new__(cls)
+            pyramid.length = int(data["length"])
+            pyramid.factor = int(data["factor"])
+            pyramid.levels = [(int(bucket), data[f"mins{i}"], data[f"maxs{i}"])
+                              for i, bucket in enumerate(data["buckets"])]
+        return pyramid
+
+    def view(self, start, end, width):
+        """Return (x, mins, maxs) covering samples [start, end) at roughly `width` buckets"""
+        start = max(0, int(start))
+        end = min(self.length, int(end))
+        width = max(1, int(width))
+        span = max(1, end - start)
+
+        # Coarsest level that still gives at least one bucket per pixel
+        bucket, mins, maxs = self.levels[0]
+        for level in self.levels[1:]:
+            if span / level[0] < width:
+                break
+            bucket, mins, maxs = level
+
+        first = start // bucket
+        last = min(len(mins), -(-end // bucket))
+        x = (np.arange(first, last) + 0.5) * bucket
+        return x, mins[first:last], maxs[first:last]
+
+class SpectrogramPyramid:
+    """Log-frequency spectrogram stored as 8-bit dB images at several zoom levels"""
+    def __init__(self, source, report=None):
+        self.length = source.frames
+        size, hop = SPECTROGRAM_FFT_SIZE, SPECTROGRAM_HOP
+        window = np.hanning(size).astype(np.float32)
+        scale = np.float32(2 / window.sum())  # A full-scale sine reads 0 dB
+
+        # Each row keeps the loudest FFT bin between its edges (the nearest bin where rows are narrower)
+        freqs = np.fft.rfftfreq(size, 1 / source.frame_rate)
+        edges = np.geomspace(SPECTROGRAM_MIN_HZ, SPECTROGRAM_MAX_HZ, SPECTROGRAM_ROWS + 1)
+        bounds = np.minimum(np.searchsorted(freqs, edges), len(freqs) - 1)
+        above = edges[:-1] >= source.frame_rate / 2  # Rows past Nyquist stay at the floor
+        floor = SPECTROGRAM_FLOOR_DB
+
+        columns = -(-self.length // hop)
+        image = np.zeros((columns, SPECTROGRAM_ROWS), dtype=np.uint8)
+        for first in range(0, columns, SPECTROGRAM_CHUNK_COLUMNS):
+            count = min(SPECTROGRAM_CHUNK_COLUMNS, columns - first)
+            # Column i is centred on frame i * hop; pad with silence past either end
+            low = first * hop - size // 2
+            high = low + (count - 1) * hop + size
+            block = mono(source.pcm[max(0, low):max(0, high)]).astype(np.float32) / np.float32(source.full_scale)
+            lead = max(0, -low)
+            block = np.pad(block, (lead, high - low - lead - len(block)))
+            spectra = np.abs(np.fft.rfft(sliding_window_view(block, size)[::hop] * window, axis=1)) * scale
+            rows = np.maximum.reduceat(spectra, bounds, axis=1)[:, :-1]
+            with np.errstate(divide="ignore"):
+                codes = np.clip((20 * np.log10(rows) - floor) * (255 / -floor), 0, 255)
+            codes[:, above] = 0
+            image[first:first + count] = codes
+            if report:
+                report((first + count) / columns, "Computing spectrogram")
+
+        self.levels = [(hop, image)]  # (frames per column, image (columns, rows)), finest first
+        factor = SPECTROGRAM_LEVEL_FACTOR
+        while len(image) > SPECTROGRAM_MIN_COLUMNS:
+            full = len(image) // factor * factor
+            coarse = image[:full].reshape(-1, factor, image.shape[1]).max(axis=1)
+            if full < len(image):
+                coarse = np.vstack([coarse, image[full:].max(axis=0)])
+            image, hop = coarse, hop * factor
+            self.levels.append((hop, image))
+
+    def save(self, path):
+        arrays = {"length": np.array(self.length), "hops": np.array([hop for hop, _ in self.levels])}
+        for i, (_, image) in enumerate(self.levels):
+            arrays[f"image{i}"] = image
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            pyramid = cls.__new__(cls)
+            pyramid.length = int(data["length"])
+            pyramid.levels = [(int(hop), data[f"image{i}"]) for i, hop in enumerate(data["hops"])]
+        return pyramid
+
+    def sample(self, frames):
+        """dB image (rows, len(frames)) at evenly spaced frames, from the coarsest level that resolves them"""
+        frames = np.asarray(frames)
+        spacing = frames[1] - frames[0] if len(frames) > 1 else 1
+        hop, image = self.levels[0]
+        for level in self.levels[1:]:
+            if level[0] > spacing:
+                break
+            hop, image = level
+        index = np.clip(frames // hop, 0, len(image) - 1).astype(np.int64)
+        floor = SPECTROGRAM_FLOOR_DB
+        db = image[index].T * np.float32(-floor / 255) + np.float32(floor)
+        db[:, (frames < 0) | (frames >= self.length)] = floor
+        return db
+
+def true_peak_filter(factor=TRUE_PEAK_OVERSAMPLE, taps=TRUE_PEAK_TAPS):
+    """Windowed-sinc interpolation filter split into (factor, taps) polyphase branches"""
+    # Centred on a sample so branch 0 reproduces the input exactly
+    n = np.arange(factor * taps) - factor * taps // 2
+    h = np.sinc(n / factor) * np.hanning(factor * taps + 1)[:-1]
+    # Reverse each branch so a sliding window dot product is a convolution
+    return np.ascontiguousarray(h.reshape(taps, factor).T[:, ::-1], dtype=np.float32)
+
+def interpolated_peaks(context, phases):
+    """Per-frame, per-channel peak over the `phases` interpolated points of `context` (frames, channels)"""
+    taps = phases.shape[1]
+    windows = sliding_window_view(np.pad(context, ((taps // 2 - 1, taps - taps // 2), (0, 0))), taps, axis=0)
+    # One matrix product with the phases leading, so the max runs across whole arrays rather than
+    # along a four-element axis; several times faster than matmul on the strided windows
+    return np.abs(np.tensordot(phases, windows, axes=([1], [2]))).max(axis=0)
+
+def resized(values, count):
+    """`values` cut or zero-padded to `count` rows"""
+    if len(values) >= count:
+        return values[:count]
+    return np.concatenate([values, np.zeros((count - len(values),) + values.shape[1:], values.dtype)])
+
+def hop_max(values, hop):
+    """Maximum of `values` (frames, channels) over consecutive hops of `hop` frames"""
+    full = len(values) // hop * hop
+    out = values[:full].reshape(-1, hop, values.shape[1]).max(axis=1)
+    if full < len(values):
+        out = np.vstack([out, values[full:].max(axis=0)])
+    return out
+
+def hop_rms(values, hop):
+    """RMS of `values` (frames, channels) over consecutive hops of `hop` frames"""
+    squares = values * values
+    full = len(squares) // hop * hop
+    means = squares[:full].reshape(-1, hop, squares.shape[1]).mean(axis=1)
+    if full < len(squares):
+        means = np.vstack([means, squares[full:].mean(axis=0)])
+    return np.sqrt(means)
+
+def hop_span(start, end, hop):
+    """Slice of the hops lying wholly inside frames [start, end), or of those touching it if none do"""
+    first, last = -(-start // hop), end // hop
+    if last <= first:
+        first, last = start // hop, -(-end // hop)
+    return slice(first, last)
+
+class LevelEnvelope:
+    """Per-channel peak, RMS and optional true peak every few ms, as fractions of full scale"""
+    def __init__(self, pcm, frame_rate, full_scale, hop_ms=ENVELOPE_HOP_MS, true_peak=METER_TRUE_PEAK):
+        self.hop = max(1, frame_rate * hop_ms // 1000)
+        peaks, rms, true_peaks = [], [], []
+        step = self.hop * ENVELOPE_CHUNK_HOPS
+        taps = TRUE_PEAK_TAPS
+        phases = true_peak_filter() if true_peak else None
+
+        for start in range(0, len(pcm), step):
+            block = pcm[start:start + step].astype(np.float32) / full_scale
+            peaks.append(hop_max(np.abs(block), self.hop))
+            rms.append(hop_rms(block, self.hop))
+
+            if phases is not None:
+                # Include neighbouring samples so the interpolation is seamless across chunks
+                context = pcm[max(0, start - taps):start + step + taps].astype(np.float32) / full_scale
+                lead = min(start, taps)
+                interpolated = interpolated_peaks(context, phases)
+                true_peaks.append(hop_max(interpolated[lead:lead + len(block)], self.hop))
+
+        channels = pcm.shape[1]
+        self.peak = np.vstack(peaks) if peaks else np.zeros((0, channels), np.float32)
+        self.rms = np.vstack(rms) if rms else np.zeros((0, channels), np.float32)
+        self.true_peak = np.vstack(true_peaks) if true_peaks else None
+
+    @classmethod
+    def empty(cls, frames, channels, frame_rate, hop_ms=ENVELOPE_HOP_MS):
+        """An all-zero envelope for `frames` frames, filled in piece by piece with update()"""
+        envelope = cls.__new__(cls)
+        envelope.hop = max(1, frame_rate * hop_ms // 1000)
+        hops = -(-frames // envelope.hop)
+        envelope.peak = np.zeros((hops, channels), np.float32)
+        envelope.rms = np.zeros((hops, channels), np.float32)
+        envelope.true_peak = None
+        return envelope
+
+    def update(self, start, block):
+        """Fill in the hops of `block` (fractions of full scale) from frame `start`, a hop boundary"""
+        first = start // self.hop
+        peak = hop_max(np.abs(block), self.hop)
+        self.peak[first:first + len(peak)] = peak
+        self.rms[first:first + len(peak)] = hop_rms(block, self.hop)
+
+    def resize(self, frames):
+        """Grow or trim to cover `frames` frames"""
+        hops = -(-frames // self.hop)
+        self.peak = resized(self.peak, hops)
+        self.rms = resized(self.rms, hops)
+
+    def level_at(self, frame, hops=METER_WINDOW_HOPS):
+        """Per-channel peak (linear) over the `hops` hops ending at `frame`"""
+        index = min(frame // self.hop, len(self.peak) - 1)
+        levels = self.true_peak if self.true_peak is not None else self.peak
+        return levels[max(0, index - hops + 1):index + 1].max(axis=0)
+
+    def save(self, path):
+        arrays = {"hop": np.array(self.hop), "peak": self.peak, "rms": self.rms}
+        if self.true_peak is not None:
+            arrays["true_peak"] = self.true_peak
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            envelope = cls.__new__(cls)
+            envelope.hop = int(data["hop"])
+            envelope.peak = data["peak"]
+            envelope.rms = data["rms"]
+            envelope.true_peak = data["true_peak"] if "true_peak" in data else None
+        return envelope
+
+def k_weighting_biquads(rate):
+    """BS.1770 high-shelf and RLB high-pass (b, a) coefficients, designed for any sample rate"""
+    f0, gain_db, q = 1681.974450955533, 3.999843853973347, 0.7071752369554196
+    k = np.tan(np.pi * f0 / rate)
+    vh = 10 ** (gain_db / 20)
+    vb = vh ** 0.4996667741545416
+    a0 = 1 + k / q + k * k
+    shelf = ([(vh + vb * k / q + k * k) / a0, 2 * (k * k - vh) / a0, (vh - vb * k / q + k * k) / a0],
+             [1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0])
+
+    f0, q = 38.13547087602444, 0.5003270373238773
+    k = np.tan(np.pi * f0 / rate)
+    a0 = 1 + k / q + k * k
+    highpass = ([1.0, -2.0, 1.0], [1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0])
+    return shelf, highpass
+
+@functools.lru_cache(maxsize=8)
+def k_weighting_response(rate, nfft=LOUDNESS_FFT_SIZE):
+    """(impulse response length, rfft of the K-weighting impulse response)"""
+    length = int(K_WEIGHTING_IR_MS / 1000 * rate)
+    ir = np.zeros(length)
+    ir[0] = 1.0
+    for b, a in k_weighting_biquads(rate):
+        # The filters are IIR; run them once on an impulse and convolve with the result
+        out = np.zeros(length)
+        x1 = x2 = y1 = y2 = 0.0
+        for n, x in enumerate(ir):
+            y = b[0] * x + b[1] * x1 + b[2] * x2 - a[1] * y1 - a[2] * y2
+            x2, x1, y2, y1 = x1, x, y1, y
+            out[n] = y
+        ir = out
+    return length, np.fft.rfft(ir, nfft).astype(np.complex64)
+
+def k_weighted_power(pcm, rate, full_scale, report=None):
+    """Mean square of the K-weighted signal per channel for every complete 100 ms segment"""
+    length, response = k_weighting_response(rate)
+    channels = pcm.shape[1]
+    segment = rate // 10
+    step = max(segment, (LOUDNESS_FFT_SIZE - length + 1) // segment * segment)
+    nfft = LOUDNESS_FFT_SIZE if step + length - 1 <= LOUDNESS_FFT_SIZE else 2 * LOUDNESS_FFT_SIZE
+    if nfft != LOUDNESS_FFT_SIZE:
+        length, response = k_weighting_response(rate, nfft)
+    tail = np.zeros((channels, length - 1), dtype=np.float32)
+    powers = []
+    for start in range(0, len(pcm), step):
+        # One contiguous row per channel so the FFTs run over adjacent memory
+        x = np.array(pcm[start:start + step].T, dtype=np.float32, order='C')
+        x *= 1.0 / full_scale
+        # Overlap-add FFT convolution, all channels at once
+        spectrum = np.fft.rfft(x, nfft, axis=-1)
+        spectrum *= response
+        y = np.fft.irfft(spectrum, nfft, axis=-1)
+        y[:, :length - 1] += tail
+        tail = y[:, x.shape[1]:x.shape[1] + length - 1]
+        y = y[:, :x.shape[1] // segment * segment]
+        powers.append((y * y).reshape(channels, -1, segment).mean(axis=-1).T)
+        if report:
+            report(min(1.0, (start + step) / len(pcm)))
+    return np.vstack(powers) if powers else np.zeros((0, channels))
+
+def integrated_loudness(powers):
+    """Gated integrated loudness (LUFS) from per-segment channel powers"""
+    channels = powers.shape[1]
+    weights = np.ones(channels)
+    if channels >= 5:
+        weights[[-2, -1]] = 1.41  # Surround channels
+    if channels == 6:
+        weights[3] = 0.0          # LFE is not measured
+
+    if len(powers) < 4:
+        return float("-inf")
+    # 400 ms blocks overlapping by 75%: the mean of four consecutive 100 ms segments
+    blocks = (powers[:-3] + powers[1:-2] + powers[2:-1] + powers[3:]) / 4
+    power = blocks @ weights
+    with np.errstate(divide="ignore"):
+        loudness = -0.691 + 10 * np.log10(power)
+
+    gated = loudness > -70.0
+    if not gated.any():
+        return float("-inf")
+    relative = -0.691 + 10 * np.log10(power[gated].mean()) - 10.0
+    gated &= loudness > relative
+    return float(-0.691 + 10 * np.log10(power[gated].mean()))
+
+def measure_loudness(source, report=None):
+    """Integrated loudness, sample peak and true peak of a source, as a JSON-friendly dict"""
+    powers = k_weighted_power(source.pcm, source.frame_rate, source.full_scale, report)
+    envelope = source.envelope
+    sample_peak = float(envelope.peak.max()) if len(envelope.peak) else 0.0
+
+    if envelope.true_peak is not None:
+        true_peak = float(envelope.true_peak.max())
+    else:
+        # Inter-sample peaks only matter near the loudest samples; oversample just those hops and their
+        # neighbours, a run of adjacent hops at a time, so loud limited material costs one pass over the file
+        true_peak = sample_peak
+        threshold = sample_peak * 10 ** (-TRUE_PEAK_SEARCH_DB / 20)
+        loud = envelope.peak.max(axis=1) >= threshold
+        loud[1:] |= loud[:-1].copy()
+        loud[:-1] |= loud[1:].copy()
+        edges = np.flatnonzero(np.diff(np.concatenate([[0], loud.astype(np.int8), [0]])))
+        phases, taps = true_peak_filter(), TRUE_PEAK_TAPS
+        for first, last in edges.reshape(-1, 2) * envelope.hop:
+            for start in range(first, min(last, source.frames), TRUE_PEAK_CHUNK_FRAMES):
+                end = min(start + TRUE_PEAK_CHUNK_FRAMES, last, source.frames)
+                context = source.pcm[max(0, start - taps):end + taps].astype(np.float32) / np.float32(source.full_scale)
+                lead = min(start, taps)
+                peaks = interpolated_peaks(context, phases)[lead:lead + end - start]
+                true_peak = max(true_peak, float(peaks.max()))
+
+    with np.errstate(divide="ignore"):
+        return {"integrated": integrated_loudness(powers),
+                "sample_peak": float(20 * np.log10(sample_peak)),
+                "true_peak": float(20 * np.log10(true_peak))}
+
+def cross_correlate(a, b):
+    """sum(a[i] * b[i + lag]) for every lag via FFT; index i holds lag i - (len(a) - 1)"""
+    size = 1 << (len(a) + len(b) - 2).bit_length()
+    corr = np.fft.irfft(np.fft.rfft(b, size) * np.conj(np.fft.rfft(a, size)), size)
+    return np.concatenate([corr[size - len(a) + 1:], corr[:len(b)]])
+
+def mono(pcm):
+    return pcm.reshape(len(pcm), -1).mean(axis=1, dtype=np.float64)
+
+def estimate_alignment(reference, other, max_offset_s=ALIGN_MAX_OFFSET_S):
+    """Offset in frames such that other[n + offset] lines up with reference[n], and the drift in ppm
+
+    The drift is None when it couldn't be measured (different sample rates, too few usable windows).
+    """
+    # Coarse: correlate the RMS envelopes, which share a 10 ms time base whatever the sample rates
+    env_ref = reference.envelope.rms.mean(axis=1)
+    env_other = other.envelope.rms.mean(axis=1)
+    corr = cross_correlate(env_ref - env_ref.mean(), env_other - env_other.mean())
+    lags = np.arange(len(corr)) - (len(env_ref) - 1)
+    corr[np.abs(lags) > max_offset_s * 1000 / ENVELOPE_HOP_MS] = -np.inf
+    coarse = int(lags[np.argmax(corr)]) * other.envelope.hop
+    if reference.frame_rate != other.frame_rate:
+        return coarse, None
+
+    # Fine: the coarse lag is good to a hop either way; search that range at full rate in a few
+    # windows, each placed on the loudest part of its stretch of the file
+    window = int(ALIGN_REFINE_MS / 1000 * reference.frame_rate)
+    reach = 2 * other.envelope.hop
+    hop = reference.envelope.hop
+    points, offsets = [], []
+    for region in np.array_split(np.arange(len(env_ref)), ALIGN_POINTS):
+        if len(region) == 0:
+            continue
+        loudest = int(region[np.argmax(env_ref[region])])
+        start = min(max(0, loudest * hop - window // 2), reference.frames - window)
+        low = start + coarse - reach
+        if start < 0 or low < 0 or low + window + 2 * reach > other.frames:
+            continue
+        a = mono(reference.pcm[start:start + window])
+        b = mono(other.pcm[low:low + window + 2 * reach])
+        corr = cross_correlate(a, b)[len(a) - 1:len(a) + 2 * reach]  # Lags where b covers all of a
+        energy = np.concatenate([[0.0], np.cumsum(b * b)])
+        norm = np.sqrt((a * a).sum() * (energy[window:] - energy[:-window]))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            score = np.where(norm > 0, corr / norm, 0.0)
+        best = int(np.argmax(score))
+        if score[best] >= ALIGN_MIN_CORRELATION:
+            points.append(start)
+            offsets.append(low + best - start)
+
+    if not offsets:
+        return coarse, None
+    offset = int(np.median(offsets))
+    drift = None
+    if len(offsets) > 1:
+        drift = float(np.polyfit(points, offsets, 1)[0] * 1e6)
+    return offset, drift
+
+def matched_gains(levels):
+    """Gains that bring each integrated loudness down to the quietest; unmeasured levels get 1.0"""
+    measured = [level for level in levels if level is not None and np.isfinite(level)]
+    if not measured:
+        return [1.0] * len(levels)
+    # Only ever attenuate, so matching can't push a file into clipping
+    target = min(measured)
+    return [10 ** ((target - level) / 20) if level is not None and np.isfinite(level) else 1.0
+            for level in levels]
+
+def band_levels(source, size=SPECTRUM_FFT_SIZE, bands=SPECTRUM_BANDS):
+    """Mean power per octave band in dBFS (None above Nyquist), from Hann-windowed FFTs at 50% overlap"""
+    window = np.hanning(size)
+    hop = size // 2
+    step = hop * SPECTRUM_CHUNK_FFTS
+    power = np.zeros(size // 2 + 1)
+    count = 0
+    for start in range(0, max(1, source.frames - size + 1), step):
+        block = mono(source.pcm[start:start + step + size - hop]) / source.full_scale
+        if len(block) < size:
+            block = np.pad(block, (0, size - len(block)))
+        spectra = np.fft.rfft(sliding_window_view(block, size)[::hop] * window, axis=1)
+        power += (spectra.real ** 2 + spectra.imag ** 2).sum(axis=0)
+        count += len(spectra)
+
+    # Scale so each band reads as its share of the mean square level
+    power *= 2 / (count * size * (window ** 2).sum())
+    freqs = np.fft.rfftfreq(size, 1 / source.frame_rate)
+    levels = {}
+    for centre in bands:
+        in_band = (freqs >= centre / np.sqrt(2)) & (freqs < centre * np.sqrt(2))
+        with np.errstate(divide="ignore"):
+            levels[centre] = float(10 * np.log10(power[in_band].sum())) if in_band.any() else None
+    return levels
+
+class Transport:
+    """One output clock shared by every panel; switching only changes which source is audible"""
+    def __init__(self, backend=None):
+        self.backend = backend or create_backend()
+        self.sources = []          # One AudioSource (or None) per slot
+        self.target_gains = []     # Set from the UI thread
+        self.match_gains = []      # Loudness-match correction per slot
+        self.offsets = []          # Frames each slot is shifted by to line up with the others
+        self.aliases = {}          # Slot -> slot it mirrors exactly (source, gain and offset)
+        self.gains = []            # Gain reached at the end of the last block
+        self.active = 0            # Audible slot
+        self.fade_from = None      # Slot fading out during a crossfade
+        self.fade_done = 0         # Crossfade frames rendered so far
+        self.crossfade_ms = CROSSFADE_MS
+        self.out_channels = 2
+        self.position = 0          # Next frame to render; also where playback resumes
+        self.rendered = 0          # Frames rendered since play started
+        self.loop = None           # (start, end) frames played over and over, or None
+        self.playing = False
+        self.listeners = []        # Called on the Tk thread after play/pause/stop/switch
+        self.notify_held = 0       # Inside held_notifications(); listeners run once it ends
+        self.notify_missed = False
+        self.switch_requested = None
+        self.switch_latencies = deque(maxlen=SWITCH_LATENCY_HISTORY)
+        self.lock = threading.Lock()
+
+    def add_slot(self):
+        """Reserve a slot for a panel and return its index"""
+        self.sources.append(None)
+        self.target_gains.append(1.0)
+        self.match_gains.append(1.0)
+        self.offsets.append(0)
+        self.gains.append(1.0)
+        return len(self.sources) - 1
+
+    def set_source(self, slot, source):
+        with self.lock:
+            self.sources[slot] = source
+            self.match_gains[slot] = 1.0
+            self.offsets[slot] = 0
+            for alias, target in self.aliases.items():
+                if target == slot:
+                    self.sources[alias] = source
+        self.notify()
+
+    def set_alias(self, slot, target):
+        """Make `slot` play exactly what `target` plays, so switching to either goes the same way"""
+        with self.lock:
+            if target is None:
+                self.aliases.pop(slot, None)
+                self.sources[slot] = None
+            else:
+                self.aliases[slot] = target
+                self.sources[slot] = self.sources[target]
+        self.notify()
+
+    def file_slots(self):
+        """(slot, source) for every slot holding its own loaded file"""
+        return [(slot, s) for slot, s in enumerate(self.sources)
+                if isinstance(s, AudioSource) and slot not in self.aliases]
+
+    def set_gain(self, slot, gain):
+        """Change a slot's gain; takes effect within one block"""
+        changed = gain != self.target_gains[slot]
+        self.target_gains[slot] = gain
+        if changed:
+            self.refresh_backend(settle=True)
+
+    def set_match_gain(self, slot, gain):
+        """Loudness-match gain applied on top of the slot's volume"""
+        changed = gain != self.match_gains[slot]
+        self.match_gains[slot] = gain
+        if changed:
+            self.refresh_backend(settle=True)
+            self.notify()
+
+    def set_offset(self, slot, offset):
+        """Play `slot` shifted so its frame position + offset sounds at the shared position"""
+        with self.lock:
+            changed = offset != self.offsets[slot]
+            self.offsets[slot] = offset
+        if changed:
+            self.refresh_backend(settle=True)
+            self.notify()
+
+    def refresh_backend(self, settle=False):
+        """Let a backend that renders ahead (simpleaudio) start again from what is heard now,
+        with `settle` only once the value has stopped changing, as while a slider is dragged"""
+        if self.playing and self.backend:
+            self.backend.refresh(self, settle)
+
+    def poll(self):
+        """Let a backend without a callback (simpleaudio) render on, and notice when it stops on its own"""
+        if self.playing and self.backend:
+            self.backend.poll(self)
+        if self.playing and self.backend and not self.backend.is_active():
+            with self.lock:
+                self.playing = False
+            self.notify()
+
+    def set_loop(self, start=None, end=None):
+        """Loop frames [start, end) of every slot together; no arguments clears the loop"""
+        with self.lock:
+            if start is None:
+                self.loop = None
+            else:
+                start, end = max(0, int(start)), min(self.frames, int(end))
+                if end <= start:
+                    raise ValueError("Loop region is empty")
+                self.loop = (start, end)
+                if not start <= self.position < end:
+                    self.position = start
+                    self.rendered = 0
+        self.notify()
+
+    def slot_gain(self, slot):
+        slot = self.aliases.get(slot, slot)
+        return self.target_gains[slot] * self.match_gains[slot]
+
+    @property
+    def source(self):
+        return self.sources[self.active] if self.sources else None
+
+    @property
+    def frame_rate(self):
+        return self.source.frame_rate if self.source else 0
+
+    @property
+    def frames(self):
+        return max((s.frames - self.offsets[self.aliases.get(i, i)] for i, s in enumerate(self.sources) if s),
+                   default=0)
+
+    def playback_frame(self):
+        """Frame being heard now: frames handed to the device minus those still queued in it"""
+        if not self.playing:
+            return self.position
+        frame = self.position - min(self.rendered, self.backend.queued_frames(self.frame_rate))
+        if self.loop and frame < self.loop[0] <= self.position:
+            # Still hearing the previous pass: map back to before the wrap
+            start, end = self.loop
+            frame = start + (frame - start) % (end - start)
+        return frame
+
+    def check_switchable(self, slot):
+        """Raise ValueError if `slot` can't join the running stream without a gap"""
+        source, current = self.sources[slot], self.source
+        if source is None:
+            raise ValueError("No file loaded")
+        if current is not None and self.playing and source.frame_rate != current.frame_rate:
+            raise ValueError(f"Sample rates differ ({current.frame_rate} Hz vs {source.frame_rate} Hz)")
+
+    def play(self, slot=None):
+        """Start or resume from the shared position, optionally making `slot` audible"""
+        if self.backend is None:
+            raise RuntimeError("No audio output available. Install sounddevice or simpleaudio.")
+        if self.playing:
+            if slot is not None:
+                self.switch(slot)
+            return
+        if slot is not None:
+            if self.sources[slot] is None:
+                raise ValueError("No file loaded")
+            self.active = slot
+        source = self.source
+        with self.lock:
+            self.out_channels = max(s.channels for s in self.sources if s)
+            if self.loop and not self.loop[0] <= self.position < self.loop[1]:
+                self.position = self.loop[0]
+            elif self.position >= self.frames:
+                self.position = 0  # Played to the end last time; start over
+            self.rendered = 0
+            self.gains = [self.slot_gain(i) for i in range(len(self.sources))]  # No ramp up at the start
+            self.fade_from = None
+            self.playing = True
+        self.backend.start(self, source.frame_rate, self.out_channels)
+        self.notify()
+
+    def pause(self):
+        if not self.playing:
+            return
+        # Resume exactly where the listener stopped hearing; audio still queued is dropped
+        frame = self.playback_frame()
+        self.halt()
+        self.position = frame
+        self.notify()
+
+    def stop(self):
+        self.halt()
+        self.position = 0
+        self.notify()
+
+    def halt(self):
+        with self.lock:
+            self.playing = False
+        if self.backend:
+            self.backend.stop()
+
+    def switch(self, slot=None):
+        """Make another slot audible at the same frame; defaults to the next loaded slot"""
+        if slot is None:
+            loaded = [i for i, s in enumerate(self.sources) if s is not None and i != self.active]
+            later = [i for i in loaded if i > self.active]
+            if not loaded:
+                return
+            slot = later[0] if later else loaded[0]
+        if slot == self.active:
+            return
+        self.check_switchable(slot)
+        with self.lock:
+            if self.playing and self.crossfade_ms > 0:
+                self.fade_from = self.active
+                self.fade_done = 0
+            self.gains[slot] = self.slot_gain(slot)
+            self.active = slot
+            if self.playing:
+                self.switch_requested = time.perf_counter()
+        self.refresh_backend()
+        self.notify()
+
+    def notify(self):
+        if self.notify_held:
+            self.notify_missed = True
+            return
+        for listener in self.listeners:
+            listener()
+
+    @contextlib.contextmanager
+    def held_notifications(self):
+        """Make several changes with the listeners called once at the end, never in between"""
+        self.notify_held += 1
+        try:
+            yield
+        finally:
+            self.notify_held -= 1
+            if not self.notify_held and self.notify_missed:
+                self.notify_missed = False
+                self.notify()
+
+    def switch_latency_ms(self):
+        """(last, mean, max) request-to-audible switch latency in ms, or None before any switch"""
+        if not self.switch_latencies:
+            return None
+        values = list(self.switch_latencies)
+        return values[-1] * 1000, sum(values) / len(values) * 1000, max(values) * 1000
+
+    def is_playing(self):
+        return self.playing and self.backend.is_active()
+
+    def source_frames(self, slot, start, frames):
+        """Unscaled frames of one slot as float32 (frames, out_channels), silence outside the file"""
+        source = self.sources[slot]
+        out = np.zeros((frames, self.out_channels), dtype=np.float32)
+        if source is None:
+            return out
+        start += self.offsets[self.aliases.get(slot, slot)]
+        skip = min(frames, max(0, -start))  # Shifted to start later: silence until it begins
+        block = source.pcm[start + skip:max(0, start + frames)]
+        count = skip + len(block)
+        if source.channels == self.out_channels or source.channels == 1:
+            out[skip:count] = block
+        else:  # Channels the source lacks stay silent
+            shared = min(source.channels, self.out_channels)
+            out[skip:count, :shared] = block[:, :shared]
+        return out
+
+    def loop_frames(self, slot, start, frames):
+        """Like source_frames, but wrapping from the loop's end back to its start"""
+        loop_start, loop_end = self.loop
+        parts = []
+        while frames > 0:
+            count = min(frames, loop_end - start)
+            part = self.source_frames(slot, start, count)
+            fade = min(int(LOOP_CROSSFADE_MS / 1000 * self.frame_rate), (loop_end - loop_start) // 2)
+            first = max(start, loop_end - fade)
+            if fade and first < start + count:
+                # Blend the tail into the audio just before the loop start, so the wrap
+                # continues the waveform it is already playing instead of jumping
+                t = ((np.arange(first, start + count) - (loop_end - fade) + 0.5) / fade * np.pi / 2)[:, np.newaxis]
+                lead = self.source_frames(slot, first - (loop_end - loop_start), start + count - first)
+                tail = part[first - start:]
+                tail[:] = tail * np.cos(t) + lead * np.sin(t)
+            parts.append(part)
+            frames -= count
+            start = loop_start if start + count >= loop_end else start + count
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def read_slot(self, slot, start, frames):
+        """Frames of one slot as float32 (frames, out_channels) with its gain ramp applied"""
+        source = self.sources[slot]
+        if source is None:
+            return np.zeros((frames, self.out_channels), dtype=np.float32)
+        if self.loop and self.loop[0] <= start < self.loop[1]:
+            out = self.loop_frames(slot, start, frames)
+        else:
+            out = self.source_frames(slot, start, frames)
+
+        # Glide towards the target gain; the ramp runs per sample so there are no steps
+        alpha = 1.0 - np.exp(-frames / (GAIN_SMOOTHING_MS / 1000 * source.frame_rate))
+        gain, target = self.gains[slot], self.slot_gain(slot)
+        end_gain = gain + (target - gain) * alpha
+        if abs(end_gain - target) < 1e-4:
+            end_gain = target
+        scale = 1.0 / source.full_scale
+        if end_gain == gain:
+            out *= end_gain * scale
+        else:
+            ramp = np.linspace(gain, end_gain, frames, endpoint=False, dtype=np.float32)
+            out *= (ramp * scale)[:, np.newaxis]
+        self.gains[slot] = end_gain
+        return out
+
+    def render(self, frames):
+        """Return the next `frames` frames of the audible slot, silence past the end"""
+        with self.lock:
+            if not self.playing:
+                return np.zeros((frames, self.out_channels), dtype=np.float32)
+            start = self.position
+            out = self.read_slot(self.active, start, frames)
+
+            if self.fade_from is not None:
+                # Equal-power crossfade from the previous slot, continuing across blocks
+                fade_frames = max(1, int(self.crossfade_ms / 1000 * self.source.frame_rate))
+                t = np.clip((self.fade_done + np.arange(frames)) / fade_frames, 0.0, 1.0)[:, np.newaxis]
+                old = self.read_slot(self.fade_from, start, frames)
+                out = out * np.sin(t * np.pi / 2) + old * np.cos(t * np.pi / 2)
+                self.fade_done += frames
+                if self.fade_done >= fade_frames:
+                    self.fade_from = None
+
+            if self.switch_requested is not None:
+                latency = time.perf_counter() - self.switch_requested + self.backend.output_latency()
+                self.switch_latencies.append(latency)
+                self.switch_requested = None
+
+            self.position += frames
+            self.rendered += frames
+            if self.loop and self.loop[0] <= start < self.loop[1] and self.position >= self.loop[1]:
+                loop_start, loop_end = self.loop
+                self.position = loop_start + (self.position - loop_start) % (loop_end - loop_start)
+            elif self.position >= self.frames:
+                self.playing = False  # Every source has reached its end
+            return out.astype(np.float32, copy=False)
+
+class SoundDeviceBackend:
+    """PortAudio output stream that pulls blocks from the transport in its callback"""
+    def __init__(self):
+        self.stream = None
+        self.config = None
+        self.transport = None
+        self.callback_time = 0.0
+
+    def start(self, transport, frame_rate, channels):
+        self.transport = transport
+        if self.config != (frame_rate, channels):
+            self.close()
+            self.stream = sd.OutputStream(samplerate=frame_rate, channels=channels, dtype='float32',
+                                          blocksize=PLAYBACK_BLOCK_FRAMES, latency='low',
+                                          callback=self.callback)
+            self.config = (frame_rate, channels)
+        if self.stream.active:
+            return  # Already running; the transport just moved to a new position
+        if not self.stream.stopped:
+            self.stream.stop()  # Finished via CallbackStop but not yet reset
+        self.stream.start()
+
+    def callback(self, outdata, frames, time_info, status):
+        outdata[:] = self.transport.render(frames)
+        self.callback_time = time.perf_counter()
+        if not self.transport.playing:
+            raise sd.CallbackStop()
+
+    def stop(self):
+        if self.stream and self.stream.active:
+            self.stream.abort()  # Drop queued audio so pause is immediate
+
+    def refresh(self, transport, settle=False):
+        pass  # Rendered block by block; every change is heard within one block
+
+    def poll(self, transport):
+        pass
+
+    def is_active(self):
+        return bool(self.stream and self.stream.active)
+
+    def output_latency(self):
+        """Seconds between rendering a block and hearing it"""
+        return self.stream.latency if self.stream else 0.0
+
+    def queued_frames(self, frame_rate):
+        """Frames rendered but not yet heard; the device drains the last block between callbacks"""
+        if not self.stream:
+            return 0
+        drained = min(PLAYBACK_BLOCK_FRAMES, (time.perf_counter() - self.callback_time) * frame_rate)
+        return int(self.stream.latency * frame_rate + PLAYBACK_BLOCK_FRAMES - drained)
+
+    def close(self):
+        if self.stream:
+            self.stream.abort()
+            self.stream.close()
+            self.stream = None
+            self.config = None
+
+class SimpleAudioBackend:
+    """Fallback without PortAudio: plays a few seconds at a time, each rendered into one buffer"""
+    def __init__(self):
+        self.play_obj = None
+        self.start_time = 0.0
+        self.rendered = 0
+        self.config = None       # (frame_rate, channels) of the buffer playing
+        self.more = False        # Whether the transport has audio left after this buffer
+        self.refresh_due = None  # perf_counter() at which a settled change is rendered
+
+    def start(self, transport, frame_rate, channels):
+        self.stop()
+        self.config = (frame_rate, channels)
+        frames = int(SIMPLEAUDIO_CHUNK_SECONDS * frame_rate)
+        if not transport.loop:
+            frames = max(1, min(frames, transport.frames - transport.position))
+        audio = transport.render(frames)
+        self.more = transport.playing
+        self.rendered = len(audio)
+        self.start_time = time.perf_counter()
+        pcm = (np.clip(audio, -1.0, 1.0) * 32767).astype(np.int16)
+        self.play_obj = sa.play_buffer(pcm, num_channels=channels, bytes_per_sample=2, sample_rate=frame_rate)
+        transport.playing = True  # Rendering may have reached the end, but the device is still playing it
+
+    def stop(self):
+        self.refresh_due = None
+        if self.play_obj and self.play_obj.is_playing():
+            self.play_obj.stop()
+
+    def refresh(self, transport, settle=False):
+        """Render again from the frame being heard, or a switch or gain change would go unheard"""
+        if not self.is_active():
+            return  # Between buffers; the next one is rendered with the change
+        if settle:
+            self.refresh_due = time.perf_counter() + SIMPLEAUDIO_SETTLE_MS / 1000
+            return
+        frame = transport.playback_frame()
+        with transport.lock:
+            transport.position = frame
+            transport.rendered = 0
+            transport.playing = True  # The last render reached the end and cleared it
+        self.start(transport, *self.config)
+
+    def poll(self, transport):
+        """Called every frame tick: pick up settled changes and start the next buffer when one ends"""
+        if self.refresh_due is not None and time.perf_counter() >= self.refresh_due:
+            self.refresh(transport)
+        elif self.more and not self.is_active():
+            self.start(transport, *self.config)
+
+    def is_active(self):
+        return bool(self.play_obj and self.play_obj.is_playing())
+
+    def output_latency(self):
+        return 0.0
+
+    def queued_frames(self, frame_rate):
+        """simpleaudio reports no position, so this falls back to elapsed time"""
+        elapsed = int((time.perf_counter() - self.start_time) * frame_rate)
+        return max(0, self.rendered - elapsed)
+
+    def close(self):
+        self.stop()
+
+class NullBackend:
+    """Output that discards the audio, pulling blocks from a thread at the real-time pace (for --benchmark)"""
+    def __init__(self):
+        self.transport = None
+        self.thread = None
+        self.running = False
+        self.first_block = None  # perf_counter() when the first block after start() was rendered
+        self.render_times = []   # Seconds spent in each transport.render() call
+
+    def start(self, transport, frame_rate, channels):
+        self.stop()
+        self.transport = transport
+        self.first_block = None
+        self.running = True
+        self.thread = threading.Thread(target=self.run, args=(PLAYBACK_BLOCK_FRAMES / frame_rate,), daemon=True)
+        self.thread.start()
+
+    def run(self, period):
+        deadline = time.perf_counter()
+        while self.running and self.transport.playing:
+            started = time.perf_counter()
+            self.transport.render(PLAYBACK_BLOCK_FRAMES)
+            finished = time.perf_counter()
+            self.render_times.append(finished - started)
+            if self.first_block is None:
+                self.first_block = finished
+            deadline += period
+            time.sleep(max(0.0, deadline - time.perf_counter()))
+        self.running = False
+
+    def stop(self):
+        self.running = False
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join()
+
+    def is_active(self):
+        return self.running
+
+    def refresh(self, transport, settle=False):
+        pass
+
+    def poll(self, transport):
+        pass
+
+    def output_latency(self):
+        return 0.0
+
+    def queued_frames(self, frame_rate):
+        return 0
+
+    def close(self):
+        self.stop()
+
+def create_backend():
+    """Pick the best available output backend, or None if there is no audio library"""
+    if sd is not None:
+        return SoundDeviceBackend()
+    if sa is not None:
+        return SimpleAudioBackend()
+    return None
+
+class LoadCancelled(Exception):
+    """Raised inside a load job when the user cancels it"""
+
+class AudioSource:
+    """A decoded file together with everything derived from it at load time"""
+    def __init__(self, path, pcm, frame_rate, sample_width, metadata, peaks, envelope):
+        self.path = path
+        # (frames, channels) in the file's own dtype, memory-mapped on a cache hit. This is the
+        # only copy of the audio; everything else reads slices of it, so it is kept read-only.
+        if pcm.flags.writeable:
+            pcm.setflags(write=False)
+        self.pcm = pcm
+        self.frame_rate = frame_rate
+        self.sample_width = sample_width
+        self.metadata = metadata
+        self.peaks = peaks
+        self.envelope = envelope
+        self.loudness = None   # measure_loudness() result, filled in on demand
+        self.cache_key = None  # Set when the source is backed by a DecodeCache entry
+        self.spectrogram = None  # SpectrogramPyramid, computed when first shown
+        self.complete = True     # False while a streamed decode is still filling pcm
+        self.origin = None       # Original frame_rate, channels and sample_width if converted
+        self.match_pending = False  # Loaded while another file was still streaming; converted once it completes
+
+    @property
+    def frames(self):
+        return self.pcm.shape[0]
+
+    @property
+    def channels(self):
+        return self.pcm.shape[1]
+
+    @property
+    def duration_ms(self):
+        return self.frames * 1000 / self.frame_rate
+
+    @property
+    def format(self):
+        return os.path.splitext(self.path)[1][1:].lower()
+
+    @property
+    def full_scale(self):
+        if self.pcm.dtype.kind == "f":
+            return 1.0  # Converted sources are float32 already
+        return float(2 ** (8 * self.sample_width - 1))
+
+    @property
+    def is_mapped(self):
+        """True when the PCM is backed by a cache file rather than process memory"""
+        return isinstance(self.pcm, np.memmap)
+
+    def memory_usage(self):
+        """(bytes held in process memory, bytes memory-mapped from the cache)"""
+        derived = sum(mins.nbytes + maxs.nbytes for _, mins, maxs in self.peaks.levels)
+        derived += self.envelope.peak.nbytes + self.envelope.rms.nbytes
+        if self.envelope.true_peak is not None:
+            derived += self.envelope.true_peak.nbytes
+        if self.is_mapped:
+            return derived, self.pcm.nbytes
+        return derived + self.pcm.nbytes, 0
+
+# Sources currently open in any panel, so loading the same file twice shares one buffer
+OPEN_SOURCES = weakref.WeakValueDictionary()
+OPEN_SOURCES_LOCK = threading.Lock()
+
+def format_bytes(count):
+    for unit in ("B", "KB", "MB"):
+        if count < 1024:
+            return f"{count:.0f} {unit}" if unit == "B" else f"{count:.1f} {unit}"
+        count /= 1024
+    return f"{count:.2f} GB"
+
+class DecodeCache:
+    """Decoded files on disk, keyed by path, size, mtime and a hash of the file contents"""
+    def __init__(self, root=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+
+    def key(self, path):
+        """Cache key for a file; hashes its head and tail so big files stay cheap to look up"""
+        st = os.stat(path)
+        digest = hashlib.sha1(f"{CACHE_VERSION}|{os.path.abspath(path)}|{st.st_size}|{st.st_mtime_ns}".encode())
+        with open(path, 'rb') as f:
+            digest.update(f.read(CACHE_HASH_BYTES))
+            if st.st_size > 2 * CACHE_HASH_BYTES:
+                f.seek(-CACHE_HASH_BYTES, os.SEEK_END)
+                digest.update(f.read(CACHE_HASH_BYTES))
+        return digest.hexdigest()
+
+    def load(self, path, key):
+        """Reopen a cached decode with the PCM memory-mapped, or return None on a miss"""
+        entry = os.path.join(self.root, key)
+        try:
+            with open(os.path.join(entry, "meta.json")) as f:
+                meta = json.load(f)
+            pcm = np.load(os.path.join(entry, "pcm.npy"), mmap_mode='r')
+            peaks = PeakPyramid.load(os.path.join(entry, "peaks.npz"))
+            envelope = LevelEnvelope.load(os.path.join(entry, "envelope.npz"))
+        except (OSError, ValueError, KeyError):
+            return None
+        os.utime(os.path.join(entry, "meta.json"))  # Mark as recently used
+        source = AudioSource(path, pcm, meta["frame_rate"], meta["sample_width"], meta["metadata"], peaks, envelope)
+        source.cache_key = key
+        source.origin = meta.get("origin")
+        source.loudness = self.load_json(key, "loudness.json")
+        return source
+
+    def load_json(self, key, name):
+        """Read an analysis result stored next to a cached decode, or None"""
+        try:
+            with open(os.path.join(self.root, key, name)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def entry_file(self, key, name):
+        """Path of an analysis file stored next to a cached decode"""
+        return os.path.join(self.root, key, name)
+
+    def save_json(self, key, name, data):
+        """Store an analysis result next to a cached decode"""
+        path = os.path.join(self.root, key, name)
+        try:
+            with open(path + ".tmp", "w") as f:
+                json.dump(data, f)
+            os.replace(path + ".tmp", path)
+        except OSError:
+            pass  # Entry was evicted meanwhile
+
+    def store(self, key, source):
+        """Write a decoded file to the cache, then evict old entries if over the size limit"""
+        tmp = self.begin(key)
+        try:
+            np.save(os.path.join(tmp, "pcm.npy"), source.pcm)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)  # Disk full
+            return
+        self.commit(key, tmp, source)
+
+    def begin(self, key):
+        """Private directory to build an entry in; its pcm.npy can be written before commit()"""
+        tmp = f"{os.path.join(self.root, key)}.tmp-{os.getpid()}-{threading.get_ident()}"
+        os.makedirs(tmp, exist_ok=True)
+        return tmp
+
+    def commit(self, key, tmp, source):
+        """Add the derived data to an entry built in `tmp` and publish it under `key`"""
+        try:
+            source.peaks.save(os.path.join(tmp, "peaks.npz"))
+            source.envelope.save(os.path.join(tmp, "envelope.npz"))
+            meta = {"path": source.path, "frame_rate": source.frame_rate, "sample_width": source.sample_width,
+                    "metadata": source.metadata, "origin": source.origin}
+            with open(os.path.join(tmp, "meta.json"), "w") as f:
+                json.dump(meta, f)
+            os.rename(tmp, os.path.join(self.root, key))
+        except OSError:
+            # Another loader stored the same file first, or the disk is full
+            shutil.rmtree(tmp, ignore_errors=True)
+        self.evict()
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits in max_bytes"""
+        with self.lock:
+            entries = []
+            for name in os.listdir(self.root):
+                entry = os.path.join(self.root, name)
+                try:
+                    size = sum(f.stat().st_size for f in os.scandir(entry))
+                    used = os.stat(os.path.join(entry, "meta.json")).st_mtime
+                except OSError:
+                    continue  # Entry still being written
+                entries.append((used, size, entry))
+
+            total = sum(size for _, size, _ in entries)
+            for used, size, entry in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                # Memory-mapped readers keep their data; the file is only unlinked
+                shutil.rmtree(entry, ignore_errors=True)
+                total -= size
+
+class LoadJob:
+    """A file load running on the worker pool; progress is polled from the Tk thread"""
+    def __init__(self, path):
+        self.path = path
+        self.fraction = 0.0
+        self.message = "Queued"
+        self.cancel_event = threading.Event()
+        self.future = None
+        self.partial = None  # Source being streamed, playable before the load finishes
+
+    def report(self, fraction, message):
+        """Called from the worker; raises LoadCancelled if the user gave up"""
+        if self.cancel_event.is_set():
+            raise LoadCancelled()
+        self.fraction = fraction
+        self.message = message
+
+    def cancel(self):
+        self.cancel_event.set()
+        if self.future:
+            self.future.cancel()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+def load_source(path, job=None, cache=None):
+    """Decode a file and build its waveform data; runs on a worker thread"""
+    report = job.report if job else (lambda fraction, message: None)
+    cache = cache if cache is not None else (DECODE_CACHE if USE_DECODE_CACHE else None)
+
+    st = os.stat(path)
+    identity = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    with OPEN_SOURCES_LOCK:
+        source = OPEN_SOURCES.get(identity)
+    if source:
+        report(1.0, "Done")
+        return source  # Already open in another panel
+
+    key = None
+    if cache:
+        report(0.0, "Checking cache")
+        key = cache.key(path)
+        source = cache.load(path, key)
+        if source:
+            report(1.0, "Done")
+            return remember_source(identity, source)
+
+    probe = probe_audio(path)
+    if probe and probe[3] >= STREAM_MIN_SECONDS * probe[0]:
+        return remember_source(identity, stream_source(path, probe, job, cache, key))
+
+    from pydub import AudioSegment
+    from mutagen import File as MutagenFile
+
+    report(0.05, "Decoding")
+    audio = AudioSegment.from_file(path)  # ffmpeg decodes in its own process
+
+    report(0.6, "Reading tags")
+    tags = MutagenFile(path, easy=True)
+    metadata = {k: list(v) for k, v in tags.items()} if tags else {}
+
+    report(0.7, "Building waveform")
+    pcm = np.frombuffer(audio.raw_data, dtype=SAMPLE_DTYPES[audio.sample_width]).reshape(-1, audio.channels)
+    peaks = PeakPyramid(pcm)
+
+    report(0.75, "Measuring levels")
+    envelope = LevelEnvelope(pcm, audio.frame_rate, float(2 ** (8 * audio.sample_width - 1)))
+    source = AudioSource(path, pcm, audio.frame_rate, audio.sample_width, metadata, peaks, envelope)
+
+    if cache:
+        report(0.85, "Caching")
+        try:
+            cache.store(key, source)
+        except OSError:
+            return source  # Cache is optional; keep the in-memory decode
+        # Swap the decoded bytes for the cached file so the audio lives in the page cache
+        source = cache.load(path, key) or source
+
+    report(1.0, "Done")
+    return remember_source(identity, source)
+
+def probe_audio(path):
+    """(frame_rate, channels, sample_width, approximate frames) without decoding, or None"""
+    try:
+        with wave.open(path, "rb") as w:
+            width = 4 if w.getsampwidth() == 3 else w.getsampwidth()  # 24-bit is widened to 32-bit
+            return w.getframerate(), w.getnchannels(), width, w.getnframes()
+    except (wave.Error, EOFError, OSError):
+        pass
+    try:
+        from pydub.utils import mediainfo_json
+        info = mediainfo_json(path)  # ffprobe
+        stream = next(s for s in info["streams"] if s.get("codec_type") == "audio")
+        bits = int(stream.get("bits_per_raw_sample") or stream.get("bits_per_sample") or 16)
+        frame_rate = int(stream["sample_rate"])
+        duration = float(stream.get("duration") or info["format"]["duration"])
+        return frame_rate, int(stream["channels"]), 2 if bits <= 16 else 4, int(duration * frame_rate)
+    except (StopIteration, KeyError, ValueError, TypeError, OSError):
+        return None
+
+def wave_pcm(raw, sample_width, channels):
+    """Raw WAV frames in the same layout pydub gives: signed, 24-bit widened to 32-bit"""
+    if sample_width == 3:
+        wide = np.zeros((len(raw) // 3, 4), dtype=np.uint8)
+        wide[:, 1:] = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3)
+        return wide.view("<i4").reshape(-1, channels)
+    if sample_width == 1:
+        return (np.frombuffer(raw, dtype=np.uint8).astype(np.int16) - 128).astype(np.int8).reshape(-1, channels)
+    return np.frombuffer(raw, dtype=SAMPLE_DTYPES[sample_width]).reshape(-1, channels)
+
+def decode_chunks(path, frame_rate, channels, sample_width, chunk_frames):
+    """Yield (frames, channels) PCM blocks of `chunk_frames` frames as the decoder produces them"""
+    try:
+        reader = wave.open(path, "rb")
+    except (wave.Error, EOFError):
+        reader = None
+    if reader:
+        with reader:
+            while True:
+                raw = reader.readframes(chunk_frames)
+                if not raw:
+                    return
+                yield wave_pcm(raw, reader.getsampwidth(), channels)
+
+    # Anything else goes through the same ffmpeg pydub uses, as raw PCM on a pipe
+    from pydub import AudioSegment
+    codec = "s16le" if sample_width == 2 else "s32le"
+    process = subprocess.Popen([AudioSegment.converter, "-nostdin", "-v", "error", "-i", path, "-vn",
+                                "-ar", str(frame_rate), "-ac", str(channels), "-f", codec, "-acodec", f"pcm_{codec}", "-"],
+                               stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            raw = process.stdout.read(chunk_frames * channels * sample_width)
+            if not raw:
+                break
+            yield np.frombuffer(raw, dtype=SAMPLE_DTYPES[sample_width]).reshape(-1, channels)
+        if process.wait() != 0:
+            raise RuntimeError(f"ffmpeg could not decode {os.path.basename(path)}")
+    finally:
+        if process.poll() is None:
+            process.kill()  # Load cancelled
+        process.stdout.close()
+        process.wait()
+
+class PCMSpool:
+    """Decoded PCM written straight into an .npy file and mapped back, so a long decode never sits in RAM"""
+    def __init__(self, path, dtype, channels, frames):
+        self.path = path
+        self.frames = 0  # Frames written so far
+        self.array = np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=(max(1, frames), channels))
+
+    def append(self, block):
+        end = self.frames + len(block)
+        if end > len(self.array):
+            self.resize(max(end, len(self.array) * 5 // 4))  # Longer than probed
+        self.array[self.frames:end] = block
+        self.frames = end
+
+    def filled(self):
+        """Read-only view of the frames written so far"""
+        view = self.array[:self.frames]
+        view.setflags(write=False)
+        return view
+
+    def resize(self, frames):
+        """Rewrite the shape in the .npy header (numpy leaves room for it to grow) and remap"""
+        self.array.flush()
+        header = {"descr": np.lib.format.dtype_to_descr(self.array.dtype), "fortran_order": False,
+                  "shape": (frames, self.array.shape[1])}
+        with open(self.path, "r+b") as f:
+            np.lib.format.write_array_header_1_0(f, header)
+            if f.tell() != self.array.offset:
+                raise OSError(f"Can't resize {self.path} in place")
+            f.truncate(self.array.offset + frames * self.array.shape[1] * self.array.itemsize)
+        self.array = np.load(self.path, mmap_mode="r+")
+
+    def finish(self):
+        """Trim to the frames written and return them mapped read-only"""
+        if self.frames == 0:
+            raise ValueError("The file contains no audio")
+        self.resize(self.frames)
+        self.array.flush()
+        self.array = None
+        return np.load(self.path, mmap_mode="r")
+
+def stream_source(path, probe, job=None, cache=None, key=None):
+    """Decode a long file chunk by chunk into a spool file, publishing a playable partial source as it grows"""
+    report = job.report if job else (lambda fraction, message: None)
+    frame_rate, channels, sample_width, estimate = probe
+
+    from mutagen import File as MutagenFile
+
+    report(0.0, "Reading tags")
+    tags = MutagenFile(path, easy=True)
+    metadata = {k: list(v) for k, v in tags.items()} if tags else {}
+
+    # The spool is the cache entry's pcm.npy when caching, so finishing needs no second copy
+    folder = cache.begin(key) if cache else tempfile.mkdtemp(prefix="audio-ab-tester-")
+    try:
+        spool = PCMSpool(os.path.join(folder, "pcm.npy"), SAMPLE_DTYPES[sample_width], channels, estimate)
+        peaks = PeakPyramid.empty(estimate)
+        envelope = LevelEnvelope.empty(estimate, channels, frame_rate)
+        source = AudioSource(path, spool.filled(), frame_rate, sample_width, metadata, peaks, envelope)
+        source.complete = False
+        if job:
+            job.partial = source
+
+        # Whole peak buckets and envelope hops per chunk, so each chunk updates its own range only
+        step = int(np.lcm(PEAK_BASE_BUCKET, envelope.hop))
+        step *= max(1, frame_rate * STREAM_CHUNK_SECONDS // step)
+        chunks = contextlib.closing(decode_chunks(path, frame_rate, channels, sample_width, step))
+        with chunks as blocks:  # Closing the generator stops ffmpeg if the load is cancelled
+            for block in blocks:
+                start = spool.frames
+                if start + len(block) > peaks.length:
+                    peaks.resize(max(start + len(block), peaks.length * 5 // 4))
+                    envelope.resize(peaks.length)
+                spool.append(block)
+                peaks.update(start, block)
+                envelope.update(start, block.astype(np.float32) / np.float32(source.full_scale))
+                source.pcm = spool.filled()
+                report(min(0.99, spool.frames / max(1, estimate)), "Decoding")
+
+        pcm = spool.finish()
+        peaks.resize(len(pcm))
+        envelope.resize(len(pcm))
+        source.pcm = pcm
+    except BaseException:
+        shutil.rmtree(folder, ignore_errors=True)
+        raise
+
+    if cache:
+        cache.commit(key, folder, source)
+        source.cache_key = key
+    else:
+        shutil.rmtree(folder, ignore_errors=True)  # The mapping keeps the data until the source is freed
+    source.complete = True
+    report(1.0, "Done")
+    return source
+
+def remember_source(identity, source):
+    """Register a source for sharing; if another loader won the race, use its buffer instead"""
+    with OPEN_SOURCES_LOCK:
+        existing = OPEN_SOURCES.get(identity)
+        if existing:
+            return existing
+        OPEN_SOURCES[identity] = source
+        return source
+
+class Resampler:
+    """Polyphase windowed-sinc (Kaiser) sample rate converter for any ratio of whole rates"""
+    def __init__(self, from_rate, to_rate, taps=RESAMPLE_TAPS, beta=RESAMPLE_BETA, rolloff=RESAMPLE_ROLLOFF):
+        g = math.gcd(from_rate, to_rate)
+        self.up, self.down = to_rate // g, from_rate // g
+        self.taps = taps
+
+        # Prototype low-pass at the upsampled rate, centred so the output is not delayed
+        n = taps * self.up
+        cutoff = rolloff * 0.5 / max(self.up, self.down)  # Cycles per upsampled sample
+        x = np.arange(n) - n / 2
+        h = 2 * cutoff * np.sinc(2 * cutoff * x) * np.kaiser(n + 1, beta)[:n] * self.up
+        # Branch p weights the `taps` input samples (oldest first) for outputs landing on phase p
+        self.branches = np.ascontiguousarray(h.reshape(taps, self.up).T[:, ::-1]).astype(np.float32)
+
+    def frames_out(self, frames):
+        return -(-frames * self.up // self.down)
+
+    def resample(self, pcm, start, count, scale=1.0):
+        """Output frames [start, start + count) of (frames, channels) `pcm` as float32, times `scale`"""
+        up, down, taps = self.up, self.down, self.taps
+        lo = start * down // up - taps // 2 + 1
+        hi = (start + count - 1) * down // up + taps // 2 + 1
+        block = np.zeros((hi - lo, pcm.shape[1]), np.float32)  # Zeros stand in outside the file
+        first, last = max(lo, 0), min(hi, len(pcm))
+        if first < last:
+            block[first - lo:last - lo] = pcm[first:last]
+            block *= scale
+        windows = sliding_window_view(block, taps, axis=0)
+
+        # Every up-th output uses the same branch and a window down inputs further on,
+        # so each branch is one matrix product over a strided view
+        out = np.empty((count, pcm.shape[1]), np.float32)
+        for r in range(min(up, count)):
+            n = start + r
+            offset = n * down // up - taps // 2 + 1 - lo
+            out[r::up] = windows[offset::down][:-(-(count - r) // up)] @ self.branches[n * down % up]
+        return out
+
+def conversion_target(source, reference):
+    """(frame_rate, channels) to convert `source` to for comparing it with `reference`, or None"""
+    channels = max(source.channels, reference.channels)
+    if source.frame_rate == reference.frame_rate and source.channels == channels:
+        return None
+    return reference.frame_rate, channels
+
+def convert_source(source, frame_rate, channels, job=None, cache=None):
+    """`source` as float32 at `frame_rate` with `channels` channels; runs on a worker thread
+
+    Mono is copied to every channel and any other missing channels are silent. The result is
+    stored in the decode cache, so converting the same file again is as fast as reloading it.
+    """
+    report = job.report if job else (lambda fraction, message: None)
+    cache = cache if cache is not None else (DECODE_CACHE if USE_DECODE_CACHE else None)
+
+    key = None
+    if cache and source.cache_key:
+        key = hashlib.sha1(f"{source.cache_key}|{frame_rate}|{channels}|"
+                           f"{RESAMPLE_TAPS}|{RESAMPLE_BETA}|{RESAMPLE_ROLLOFF}".encode()).hexdigest()
+        converted = cache.load(source.path, key)
+        if converted:
+            report(1.0, "Done")
+            return converted
+
+    resampler = Resampler(source.frame_rate, frame_rate) if source.frame_rate != frame_rate else None
+    frames = resampler.frames_out(source.frames) if resampler else source.frames
+    tmp = cache.begin(key) if key else None
+    try:
+        if tmp:
+            pcm = np.lib.format.open_memmap(os.path.join(tmp, "pcm.npy"), mode="w+", dtype=np.float32,
+                                            shape=(frames, channels))
+        else:
+            pcm = np.empty((frames, channels), np.float32)
+        mapping = [0] * channels if source.channels == 1 else list(range(min(channels, source.channels)))
+        scale = 1.0 / source.full_scale
+        for start in range(0, frames, RESAMPLE_CHUNK_FRAMES):
+            report(0.8 * start / frames, f"Resampling to {frame_rate} Hz" if resampler else "Converting")
+            count = min(RESAMPLE_CHUNK_FRAMES, frames - start)
+            if resampler:
+                block = resampler.resample(source.pcm, start, count, scale)
+            else:
+                block = source.pcm[start:start + count].astype(np.float32) * scale
+            pcm[start:start + count, :len(mapping)] = block[:, mapping]
+            pcm[start:start + count, len(mapping):] = 0
+
+        report(0.8, "Building waveform")
+        converted = AudioSource(source.path, pcm, frame_rate, 4, source.metadata, PeakPyramid(pcm),
+                                LevelEnvelope(pcm, frame_rate, 1.0))
+        converted.origin = {"frame_rate": source.frame_rate, "channels": source.channels,
+                            "sample_width": source.sample_width}
+    except BaseException:
+        if tmp:
+            shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+    if tmp:
+        report(0.9, "Caching")
+        pcm.flush()
+        cache.commit(key, tmp, converted)
+        converted = cache.load(source.path, key) or converted
+    report(1.0, "Done")
+    return converted
+
+DECODE_CACHE = DecodeCache()
+
+LOADER_POOL = ThreadPoolExecutor(max_workers=LOADER_WORKERS, thread_name_prefix="audio-loader")
+
+class DifferenceSource:
+    """A minus B after level matching and time alignment, computed block by block as it is read
+
+    Slices like a (frames, channels) float32 PCM array, so the transport plays it like any loaded
+    file without a third full-length copy; precompute() fills in its peaks and envelope.
+    """
+    full_scale = 1.0
+    path = "A - B"
+    metadata = {}
+    loudness = None
+    cache_key = None
+    spectrogram = None
+    complete = True
+    match_pending = False
+
+    def __init__(self, source_a, source_b, offsets=(0, 0), gains=(1.0, 1.0)):
+        if source_a.frame_rate != source_b.frame_rate:
+            raise ValueError(f"Sample rates differ ({source_a.frame_rate} Hz vs {source_b.frame_rate} Hz)")
+        self.inputs = [(source_a, offsets[0], gains[0]), (source_b, offsets[1], -gains[1])]
+        self.frame_rate = source_a.frame_rate
+        counts = (source_a.channels, source_b.channels)
+        self.channels = max(counts) if 1 in counts else min(counts)  # Mono is subtracted from every channel
+        self.frames = max(source.frames - offset for source, offset, _ in self.inputs)
+        # Frames where both inputs have audio. Elsewhere the difference is just one of them, which
+        # says nothing about how well they null, so the whole-file figures only cover this span.
+        start = max(max(0, -offset) for _, offset, _ in self.inputs)
+        end = min(source.frames - offset for source, offset, _ in self.inputs)
+        if end <= start:
+            raise ValueError("A and B don't overlap at these offsets")
+        self.overlap = (start, end)
+        self.pcm = self
+        self.shape = (self.frames, self.channels)
+        self.peaks = PeakPyramid.empty(self.frames)
+        self.envelope = LevelEnvelope.empty(self.frames, self.channels, self.frame_rate)
+        self.computed = 0.0   # Fraction of the peaks and envelope filled in so far
+
+    def __len__(self):
+        return self.frames
+
+    def __getitem__(self, index):
+        start, stop, _ = index.indices(self.frames)
+        out = np.zeros((max(0, stop - start), self.channels), dtype=np.float32)
+        for source, offset, gain in self.inputs:
+            low = start + offset
+            skip = min(len(out), max(0, -low))
+            block = source.pcm[low + skip:max(0, stop + offset), :self.channels]
+            out[skip:skip + len(block)] += block * np.float32(gain / source.full_scale)
+        return out
+
+    @property
+    def duration_ms(self):
+        return self.frames * 1000 / self.frame_rate
+
+    @property
+    def unmatched_ms(self):
+        """Length of the stretches where only one input has audio"""
+        start, end = self.overlap
+        return (self.frames - (end - start)) * 1000 / self.frame_rate
+
+    def precompute(self, job, playhead):
+        """Fill in peaks and envelope a block at a time, starting from wherever `playhead()` is"""
+        hop = self.envelope.hop
+        step = int(np.lcm(PEAK_BASE_BUCKET, hop))  # Blocks start on both a peak bucket and a hop
+        step *= max(1, self.frame_rate // step)
+        done = np.zeros(-(-self.frames // step), dtype=bool)
+        while not done.all():
+            # Run ahead of the cursor first, then go back for whatever was skipped
+            ahead = min(len(done) - 1, playhead() // step)
+            pending = np.flatnonzero(~done[ahead:])
+            index = ahead + pending[0] if len(pending) else np.flatnonzero(~done)[0]
+            start = int(index) * step
+            block = self[start:start + step]
+            self.peaks.update(start, block)
+            self.envelope.update(start, block)
+            done[index] = True
+            self.computed = done.mean()
+            job.report(self.computed, "Computing A - B")
+
+    def residual_db(self, frame=None):
+        """RMS level of the difference in dBFS around `frame`, or over the whole overlap"""
+        rms = self.envelope.rms
+        if frame is not None:
+            index = min(frame // self.envelope.hop, len(rms) - 1)
+            rms = rms[max(0, index - METER_WINDOW_HOPS + 1):index + 1]
+        else:
+            rms = rms[hop_span(*self.overlap, self.envelope.hop)]
+        with np.errstate(divide="ignore"):
+            return float(10 * np.log10(np.mean(rms.astype(np.float64) ** 2)))
+
+    def peak_dbfs(self):
+        """Sample peak of the difference over the overlap in dBFS"""
+        peak = self.envelope.peak[hop_span(*self.overlap, self.envelope.hop)]
+        with np.errstate(divide="ignore"):
+            return float(20 * np.log10(peak.max()))
+
+    def null_depth_db(self):
+        """Residual over the overlap relative to the level of A there as it is subtracted"""
+        source, offset, gain = self.inputs[0]
+        start, end = self.overlap
+        rms = source.envelope.rms[hop_span(start + offset, end + offset, source.envelope.hop)]
+        reference = np.mean(rms.astype(np.float64) ** 2) * gain ** 2
+        with np.errstate(divide="ignore"):
+            return self.residual_db() - float(10 * np.log10(reference))
+
+def prefetch(source, start, frames):
+    """Touch every page of frames [start, start + frames) so a memory-mapped source plays without page faults"""
+    block = source.pcm[max(0, start):max(0, start + frames)]
+    step = max(1, mmap.PAGESIZE // block.itemsize)
+    return int(np.add.reduce(block.reshape(-1)[::step], dtype=np.int64))
+
+def page_out(source, keep_start, keep_end):
+    """Drop a memory-mapped source's pages outside frames [keep_start, keep_end) from this process
+
+    The file stays in the page cache, so touching them again is a cheap minor fault, not a disk read.
+    """
+    pcm = source.pcm
+    mapping = getattr(pcm, "_mmap", None)
+    if mapping is None or not hasattr(mapping, "madvise"):
+        return
+    page = mmap.PAGESIZE
+    base = pcm.offset % mmap.ALLOCATIONGRANULARITY  # Where the array starts inside the mapping
+    first = (base + max(0, keep_start) * pcm.strides[0]) // page * page
+    last = -(-(base + min(len(pcm), max(0, keep_end)) * pcm.strides[0]) // page) * page
+    with contextlib.suppress(OSError, ValueError):
+        if first > 0:
+            mapping.madvise(mmap.MADV_DONTNEED, 0, first)
+        if last < len(mapping):
+            mapping.madvise(mmap.MADV_DONTNEED, last, len(mapping) - last)
+
+class SourcePager:
+    """Keeps every loaded source paged in around the playhead and the rest of it out of memory
+
+    Switching then costs the same however many sources are loaded, while eight long files take
+    little more memory than one: mapped sources drop the pages they no longer need, and sources
+    held in process memory beyond the budget are moved to memory-mapped spill files.
+    """
+    def __init__(self, transport, budget=MEMORY_BUDGET_BYTES):
+        self.transport = transport
+        self.budget = budget
+        self.job = None
+        self.next_time = 0.0
+        self.spill_dir = None
+
+    def tick(self, frame, playing, now):
+        """FrameScheduler tick: page in a fresh window once a second while playing, and after any change"""
+        if (not playing or now >= self.next_time) and (self.job is None or self.job.done()):
+            self.next_time = now + PAGER_INTERVAL_MS / 1000
+            active = self.transport.sources[self.transport.active] if self.transport.sources else None
+            self.job = LOADER_POOL.submit(self.page, self.windows(frame), active)
+        return playing
+
+    def windows(self, frame):
+        """(source, first, last) frames to keep resident for each loaded file at shared frame `frame`"""
+        windows = []
+        rate = self.transport.frame_rate
+        for slot, source in self.transport.file_slots():
+            scale = source.frame_rate / rate if rate else 1.0
+            here = int(frame * scale) + self.transport.offsets[slot]
+            first = here
+            if self.transport.loop:  # The wrap jumps back to the loop start
+                first = min(here, int(self.transport.loop[0] * scale) + self.transport.offsets[slot])
+            windows.append((source, first - PAGER_BEHIND_SECONDS * source.frame_rate,
+                            here + PAGER_AHEAD_SECONDS * source.frame_rate))
+        return windows
+
+    def page(self, windows, active):
+        """Worker side: trim and prefetch every window, then keep in-memory audio under the budget"""
+        for source, first, last in windows:
+            if not source.complete:
+                continue  # Still being decoded into; its pages are in use
+            if source.is_mapped:
+                page_out(source, first, last)
+            prefetch(source, first, last - first)
+
+        resident = [(s.pcm.nbytes, s) for s, _, _ in windows if s.complete and not s.is_mapped]
+        total = sum(size for size, _ in resident)
+        # The audible source is spilled last, the biggest others first
+        for size, source in sorted(resident, key=lambda item: (item[1] is active, -item[0])):
+            if total <= self.budget:
+                break
+            self.spill(source)
+            total -= size
+
+    def spill(self, source):
+        """Move a source's PCM from process memory to a memory-mapped temporary file"""
+        if self.spill_dir is None:
+            self.spill_dir = tempfile.mkdtemp(prefix="audio-ab-tester-")
+        path = os.path.join(self.spill_dir, f"{id(source)}.npy")
+        try:
+            np.save(path, source.pcm)
+            source.pcm = np.load(path, mmap_mode="r")  # Readers holding the old array finish with it
+        except OSError:
+            return  # Disk full; keep it in memory
+        finally:
+            with contextlib.suppress(OSError):
+                os.unlink(path)  # The mapping keeps the data until the source is dropped
+
+class AbxSession:
+    """Blind ABX trials: X is drawn at random each trial and every answer is appended to a log file"""
+    def __init__(self, trials=ABX_TRIALS, log_dir=ABX_LOG_DIR, **details):
+        self.trials = trials
+        self.results = []  # True for each correct answer
+        self.random = random.SystemRandom()
+        os.makedirs(log_dir, exist_ok=True)
+        self.log_path = os.path.join(log_dir, time.strftime("abx-%Y%m%d-%H%M%S.jsonl"))
+        self.log = open(self.log_path, "a")
+        self.write(event="session", trials=trials, **details)
+        self.next_trial()
+
+    def next_trial(self):
+        self.x = self.random.choice("AB")
+        self.started = time.perf_counter()
+        self.switches = 0
+
+    def answer(self, choice):
+        """Record that X sounded like `choice` ("A" or "B") and move on to the next trial"""
+        seconds = time.perf_counter() - self.started
+        self.results.append(choice == self.x)
+        self.write(event="trial", trial=len(self.results), x=self.x, answer=choice, correct=choice == self.x,
+                   response_time_s=round(seconds, 3), switches=self.switches)
+        if self.finished:
+            self.write(event="result", correct=self.correct, trials=len(self.results), p_value=self.p_value())
+            self.close()
+        else:
+            self.next_trial()
+
+    @property
+    def correct(self):
+        return sum(self.results)
+
+    @property
+    def finished(self):
+        return len(self.results) >= self.trials
+
+    def p_value(self):
+        """Chance of scoring at least this well by guessing (one-sided binomial test)"""
+        n = len(self.results)
+        return sum(math.comb(n, k) for k in range(self.correct, n + 1)) / 2 ** n
+
+    def write(self, **record):
+        # One JSON object per line, flushed at once, so an interrupted session still has its trials
+        record["time"] = time.time()
+        self.log.write(json.dumps(record) + "\n")
+        self.log.flush()
+
+    def close(self):
+        if not self.log.closed:
+            self.log.close()
+
+def index_file(path):
+    """One library row for `path`, decoding it once for loudness and the thumbnail; runs in a worker process"""
+    st = os.stat(path)
+    source = load_source(path, cache=False)  # A scan would otherwise flood the decode cache
+    loudness = measure_loudness(source)
+
+    # Min/max peaks squeezed to a fixed number of columns, stored as signed bytes of full scale
+    _, mins, maxs = source.peaks.view(0, source.frames, LIBRARY_THUMB_WIDTH)
+    if len(mins) > LIBRARY_THUMB_WIDTH:
+        edges = np.linspace(0, len(mins), LIBRARY_THUMB_WIDTH + 1).astype(int)[:-1]
+        mins, maxs = np.minimum.reduceat(mins, edges), np.maximum.reduceat(maxs, edges)
+    thumbnail = np.clip(np.concatenate([mins, maxs]) / source.full_scale * 127, -127, 127).astype(np.int8)
+
+    words = [path] + [str(value) for values in source.metadata.values() for value in values]
+    finite = lambda value: value if np.isfinite(value) else None  # Silence measures -inf
+    return {"path": path, "size": st.st_size, "mtime_ns": st.st_mtime_ns, "name": os.path.basename(path),
+            "format": source.format, "duration_s": source.duration_ms / 1000, "frame_rate": source.frame_rate,
+            "channels": source.channels, "sample_width": source.sample_width,
+            "loudness_lufs": finite(loudness["integrated"]), "peak_dbfs": finite(loudness["sample_peak"]),
+            "tags": json.dumps(source.metadata), "search": " ".join(words).lower(),
+            "thumbnail": thumbnail.tobytes()}
+
+def thumbnail_image(blob, width=LIBRARY_THUMB_WIDTH, height=LIBRARY_THUMB_HEIGHT):
+    """A stored peak thumbnail drawn in the waveform colours"""
+    image = np.empty((height, width, 3), np.uint8)
+    image[:] = ImageColor.getrgb(COLOR_SCHEME["waveform_bg"])
+    mins, maxs = np.split(np.frombuffer(blob or b"", np.int8).astype(np.float32) / 127, 2)
+    if len(mins):
+        columns = np.arange(width) * len(mins) // width
+        rows = np.arange(height)[:, None]
+        top = np.floor((1 - maxs[columns]) * (height - 1) / 2)
+        bottom = np.ceil((1 - mins[columns]) * (height - 1) / 2)
+        image[(rows >= top) & (rows <= bottom)] = ImageColor.getrgb(COLOR_SCHEME["waveform_line"])
+    return Image.fromarray(image)
+
+class LibraryIndex:
+    """SQLite index of the audio files under chosen folders; searching it never decodes anything"""
+    COLUMNS = ("path", "size", "mtime_ns", "name", "format", "duration_s", "frame_rate", "channels",
+               "sample_width", "loudness_lufs", "peak_dbfs", "tags", "search", "thumbnail", "error")
+    INSERT = f"INSERT OR REPLACE INTO files ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})"
+
+    def __init__(self, path=LIBRARY_DB):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = self.connect()
+
+    def connect(self):
+        """A connection for the calling thread; WAL lets the picker search while a scan writes"""
+        db = sqlite3.connect(self.path, timeout=30)
+        db.row_factory = sqlite3.Row
+        db.execute("PRAGMA journal_mode=WAL")
+        if db.execute("PRAGMA user_version").fetchone()[0] != LIBRARY_VERSION:
+            db.execute("DROP TABLE IF EXISTS files")  # The folders are kept; the next scan fills it again
+            db.execute(f"PRAGMA user_version = {LIBRARY_VERSION}")
+        db.execute("CREATE TABLE IF NOT EXISTS roots (path TEXT PRIMARY KEY)")
+        db.execute("CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, "
+                   "name TEXT, format TEXT, duration_s REAL, frame_rate INTEGER, channels INTEGER, "
+                   "sample_width INTEGER, loudness_lufs REAL, peak_dbfs REAL, tags TEXT, search TEXT, "
+                   "thumbnail BLOB, error TEXT)")
+        db.commit()
+        return db
+
+    def roots(self):
+        return [row[0] for row in self.db.execute("SELECT path FROM roots ORDER BY path")]
+
+    def add_root(self, root):
+        self.db.execute("INSERT OR IGNORE INTO roots VALUES (?)", (os.path.abspath(root),))
+        self.db.commit()
+
+    def scan(self, root, job=None, workers=LIBRARY_WORKERS):
+        """Index new and changed files under `root` and forget deleted ones: (indexed, removed, failed)"""
+        report = job.report if job else (lambda fraction, message: None)
+        root = os.path.abspath(root)
+        if not os.path.isdir(root):
+            raise NotADirectoryError(f"{root} is not a folder")  # An unmounted drive must not empty the index
+
+        # Size and modification time tell which files changed; only those are decoded
+        on_disk = {}
+        for folder, _, names in os.walk(root):
+            for name in names:
+                if name.lower().endswith(LIBRARY_EXTENSIONS):
+                    path = os.path.join(folder, name)
+                    with contextlib.suppress(OSError):
+                        st = os.stat(path)
+                        on_disk[path] = (st.st_size, st.st_mtime_ns)
+            report(0.0, f"Listing: {len(on_disk)} files")
+
+        db = self.connect()
+        try:
+            # Every path under root sorts between "root/" and "root0", as "0" follows the separator
+            prefix = os.path.join(root, "")
+            known = {path: (size, mtime_ns) for path, size, mtime_ns in db.execute(
+                "SELECT path, size, mtime_ns FROM files WHERE path >= ? AND path < ?",
+                (prefix, prefix[:-1] + chr(ord(os.sep) + 1)))}
+            removed = [path for path in known if path not in on_disk]
+            db.executemany("DELETE FROM files WHERE path = ?", [(path,) for path in removed])
+            changed = [path for path, stamp in on_disk.items() if known.get(path) != stamp]
+            failed = 0
+            if changed:
+                # Spawned, not forked: the scan may start from the GUI, and Tk does not survive a fork
+                pool = ProcessPoolExecutor(max_workers=min(workers, len(changed)),
+                                           mp_context=multiprocessing.get_context("spawn"))
+                try:
+                    futures = {pool.submit(index_file, path): path for path in changed}
+                    for done, future in enumerate(as_completed(futures), 1):
+                        path = futures[future]
+                        try:
+                            row = future.result()
+                        except Exception as e:
+                            # Kept with its error, so an unreadable file is not decoded again until it changes
+                            size, mtime_ns = on_disk[path]
+                            row = {"path": path, "size": size, "mtime_ns": mtime_ns, "name": os.path.basename(path),
+                                   "format": os.path.splitext(path)[1][1:].lower(), "error": str(e) or type(e).__name__}
+                            failed += 1
+                        db.execute(self.INSERT, [row.get(column) for column in self.COLUMNS])
+                        if done % LIBRARY_COMMIT_EVERY == 0:
+                            db.commit()
+                        report(done / len(changed), f"Indexed {done} of {len(changed)}")
+                finally:
+                    pool.shutdown(wait=False, cancel_futures=True)
+        finally:
+            db.commit()  # A cancelled scan keeps what it finished
+            db.close()
+        return len(changed), len(removed), failed
+
+    def search(self, text="", format=None, limit=LIBRARY_SEARCH_LIMIT):
+        """Readable files whose path or tags contain every word of `text`, optionally of one format only"""
+        clauses, params = ["error IS NULL"], []
+        for word in text.lower().split():
+            clauses.append("search LIKE ? ESCAPE '\\'")
+            params.append("%" + word.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%")
+        if format:
+            clauses.append("format = ?")
+            params.append(format)
+        query = f"SELECT * FROM files WHERE {' AND '.join(clauses)} ORDER BY path LIMIT ?"
+        return self.db.execute(query, params + [limit]).fetchall()
+
+    def formats(self):
+        return [row[0] for row in self.db.execute("SELECT DISTINCT format FROM files WHERE error IS NULL ORDER BY 1")]
+
+    def close(self):
+        self.db.close()
+
+def prepare_pair(path_a, path_b, job=None):
+    """Decode, convert, measure and align a pair before it is shown; runs on a worker thread"""
+    report = job.report if job else (lambda fraction, message: None)
+    a = load_source(path_a, job)
+    b = load_source(path_b, job)
+    target = conversion_target(b, a)
+    if target:
+        b = convert_source(b, *target, job)
+    report(0.9, "Measuring loudness")
+    analyze_loudness(a)
+    analyze_loudness(b)
+    report(0.95, "Aligning")
+    alignment = estimate_alignment(a, b)
+    for source in (a, b):
+        prefetch(source, 0, source.frame_rate * PAGER_AHEAD_SECONDS)  # So the first play never waits on disk
+    report(1.0, "Ready")
+    return a, b, alignment
+
+class Playlist:
+    """Pairs auditioned one after another; the next ones are prepared in the background meanwhile"""
+    def __init__(self, pairs, depth=PLAYLIST_PREFETCH_PAIRS, budget=PLAYLIST_MEMORY_BYTES):
+        self.pairs = pairs
+        self.depth = depth
+        self.budget = budget
+        self.current = 0
+        self.jobs = {}  # Pair index -> LoadJob preparing it; its result holds the pair's sources
+
+    def update(self):
+        """Prepare the current pair and the next `depth` while the budget allows, and release all others"""
+        window = range(self.current, min(len(self.pairs), self.current + self.depth + 1))
+        for index in [index for index in self.jobs if index not in window]:
+            self.jobs.pop(index).cancel()  # Dropping the job drops its sources
+        for index in window:
+            if index in self.jobs:
+                continue
+            # Past the next pair, one at a time, so the budget counts each pair before the next starts
+            if index > self.current + 1 and (self.state(index - 1) == "preparing"
+                                             or self.held_bytes() >= self.budget):
+                break
+            job = LoadJob(self.pairs[index][1])
+            job.future = LOADER_POOL.submit(prepare_pair, *self.pairs[index], job)
+            self.jobs[index] = job
+
+    def held_bytes(self):
+        """Audio held by the pairs prepared ahead of the current one, counting shared files once"""
+        sources = {id(source): source for index, job in self.jobs.items()
+                   if index > self.current and self.state(index) == "ready"
+                   for source in job.future.result()[:2]}
+        return sum(sum(source.memory_usage()) for source in sources.values())
+
+    def state(self, index):
+        """"ready", "failed", "preparing" or None when the pair is not being prepared"""
+        job = self.jobs.get(index)
+        if job is None:
+            return None
+        if not job.future.done():
+            return "preparing"
+        return "failed" if job.future.exception() else "ready"
+
+    @property
+    def busy(self):
+        return any(not job.future.done() for job in self.jobs.values())
+
+    def close(self):
+        for job in self.jobs.values():
+            job.cancel()
+        self.jobs.clear()
+
+class FrameScheduler:
+    """One UI tick for every animated widget, reading the playback clock once per tick
+
+    Clients have a tick(frame, playing, now) method that redraws only what changed and
+    returns True while it still needs ticks. When none does, no tick is scheduled until
+    the transport changes again.
+    """
+    def __init__(self, root, transport, interval_ms=FRAME_INTERVAL_MS):
+        self.root = root
+        self.transport = transport
+        self.interval_ms = interval_ms
+        self.clients = []
+        self.after_id = None
+        self.last_start = None
+        self.ticks = 0
+        self.durations = deque(maxlen=FRAME_STATS_HISTORY)  # Seconds spent inside each tick
+        self.intervals = deque(maxlen=FRAME_STATS_HISTORY)  # Seconds between consecutive ticks
+        transport.listeners.append(self.wake)
+
+    def add(self, client):
+        self.clients.append(client)
+        self.wake()
+
+    def wake(self):
+        """Make sure a tick is coming; called whenever something visible may have changed"""
+        if self.after_id is None:
+            self.after_id = self.root.after_idle(self.tick)
+
+    def tick(self):
+        self.transport.poll()  # While after_id is still set, so a notification here queues no second tick
+        self.after_id = None
+        start = time.perf_counter()
+        frame, playing = self.transport.playback_frame(), self.transport.playing
+        busy = False
+        for client in self.clients:
+            busy = client.tick(frame, playing, start) or busy
+        end = time.perf_counter()
+
+        self.ticks += 1
+        self.durations.append(end - start)
+        if self.last_start is not None:
+            self.intervals.append(start - self.last_start)
+        if busy:
+            self.last_start = start
+            if self.after_id is None:  # A client's notification may already have queued the next tick
+                delay = max(1, int(self.interval_ms - (end - start) * 1000))
+                self.after_id = self.root.after(delay, self.tick)
+        else:
+            self.last_start = None  # Idle gaps are not late ticks
+
+    def stats(self):
+        """Tick cost and spacing in ms, or None before the first tick"""
+        if not self.durations:
+            return None
+        durations = np.array(self.durations) * 1000
+        intervals = np.array(self.intervals or [0.0]) * 1000
+        return {
+            "ticks": self.ticks,
+            "tick_mean_ms": round(float(durations.mean()), 3),
+            "tick_p99_ms": round(float(np.percentile(durations, 99)), 3),
+            "tick_max_ms": round(float(durations.max()), 3),
+            "interval_mean_ms": round(float(intervals.mean()), 3),
+            "interval_max_ms": round(float(intervals.max()), 3),
+            "late_ticks": int((intervals > self.interval_ms * 1.5).sum()),
+        }
+
+    def stop(self):
+        if self.after_id:
+            self.root.after_cancel(self.after_id)
+            self.after_id = None
+
+class TransportStatus(tk.Label):
+    """Shows which source is audible and how long the last switch took"""
+    def __init__(self, parent, transport, names, **kwargs):
+        super().__init__(parent, font=("NimbusSansNarrow-Bold", 8), bg=COLOR_SCHEME["info_text_bg"],
+                         fg=COLOR_SCHEME["info_text_fg"], width=STATUS_WIDTH // 6, **kwargs)
+        self.transport = transport
+        self.names = names
+        transport.listeners.append(self.on_transport_change)
+        self.refresh()
+
+    def on_transport_change(self):
+        self.refresh()
+
+    def tick(self, frame, playing, now):
+        # The latency is measured once the audio thread renders the switch
+        self.refresh()
+        return self.transport.switch_requested is not None
+
+    def refresh(self):
+        state = "Playing" if self.transport.playing else "Stopped"
+        text = f"{state}: {self.names[self.transport.active]}"
+        latency = self.transport.switch_latency_ms()
+        if latency:
+            last, mean, worst = latency
+            text += f"   switch {last:.1f} ms (avg {mean:.1f}, max {worst:.1f})"
+        if text != self.cget("text"):
+            self.config(text=text)
+
+def analyze_loudness(source):
+    """Measure a source's loudness once and keep the result with its cache entry"""
+    if source.loudness is None:
+        source.loudness = measure_loudness(source)
+        if source.cache_key and USE_DECODE_CACHE:
+            DECODE_CACHE.save_json(source.cache_key, "loudness.json", source.loudness)
+    return source.loudness
+
+def analyze_spectrogram(source):
+    """Compute a source's spectrogram once and keep it with its cache entry"""
+    if source.spectrogram is None:
+        path = None
+        if source.cache_key and USE_DECODE_CACHE:
+            path = DECODE_CACHE.entry_file(source.cache_key, "spectrogram.npz")
+            try:
+                source.spectrogram = SpectrogramPyramid.load(path)
+                return source.spectrogram
+            except (OSError, ValueError, KeyError):
+                pass
+        source.spectrogram = SpectrogramPyramid(source)
+        if path:
+            try:
+                source.spectrogram.save(path[:-len(".npz")] + ".tmp.npz")
+                os.replace(path[:-len(".npz")] + ".tmp.npz", path)
+            except OSError:
+                pass  # Entry was evicted meanwhile
+    return source.spectrogram
+
+class LoudnessMatch(tk.Checkbutton):
+    """Toggle that measures every loaded source and turns the louder ones down to the quietest"""
+    def __init__(self, parent, transport, panels, **kwargs):
+        self.enabled = tk.BooleanVar(value=False)
+        super().__init__(parent, text="Match loudness", variable=self.enabled, command=self.update_gains,
+                         font=("NimbusSansNarrow-Bold", 8), bg=COLOR_SCHEME["info_text_bg"],
+                         fg=COLOR_SCHEME["info_text_fg"], selectcolor=COLOR_SCHEME["info_text_bg"],
+                         activebackground=COLOR_SCHEME["info_text_bg"], highlightthickness=0, **kwargs)
+        self.transport = transport
+        self.panels = panels
+        self.pending = {}  # id(source) -> future measuring it
+        self.poll_id = None
+        transport.listeners.append(self.update_gains)
+
+    def update_gains(self, measured_new=False):
+        """Measure whatever is missing, then set each slot's match gain"""
+        sources = self.transport.file_slots()
+        if self.enabled.get():
+            for _, source in sources:
+                if source.loudness is None and source.complete and id(source) not in self.pending:
+                    self.pending[id(source)] = LOADER_POOL.submit(analyze_loudness, source)
+        self.poll()
+
+        gains = [1.0] * len(sources)
+        if self.enabled.get():
+            gains = matched_gains([s.loudness["integrated"] if s.loudness else None for _, s in sources])
+        changed = measured_new
+        with self.transport.held_notifications():
+            for (slot, _), gain in zip(sources, gains):
+                changed |= gain != self.transport.match_gains[slot]
+                self.transport.set_match_gain(slot, gain)
+        if changed:
+            for panel in self.panels:
+                if panel.source:
+                    panel.refresh_info()
+
+    def poll(self):
+        """Pick up finished measurements on the Tk thread"""
+        if self.poll_id or not self.pending:
+            return
+        done = [key for key, future in self.pending.items() if future.done()]
+        for key in done:
+            future = self.pending.pop(key)
+            if future.exception():
+                messagebox.showerror("Error", f"Could not measure loudness:\n{future.exception()}")
+        if done:
+            self.update_gains(measured_new=True)  # Polls again for whatever is still pending
+        elif self.pending:
+            self.poll_id = self.after(LOAD_POLL_MS, self.repoll)
+
+    def repoll(self):
+        self.poll_id = None
+        self.poll()
+
+class TimeAlign(tk.Checkbutton):
+    """Toggle that lines every loaded source up with the first one, so switching keeps the beat"""
+    def __init__(self, parent, transport, panels, **kwargs):
+        self.enabled = tk.BooleanVar(value=False)
+        super().__init__(parent, text="Align", variable=self.enabled, command=self.update_offsets,
+                         font=("NimbusSansNarrow-Bold", 8), bg=COLOR_SCHEME["info_text_bg"],
+                         fg=COLOR_SCHEME["info_text_fg"], selectcolor=COLOR_SCHEME["info_text_bg"],
+                         activebackground=COLOR_SCHEME["info_text_bg"], highlightthickness=0, **kwargs)
+        self.transport = transport
+        self.panels = panels
+        self.results = {}  # (reference, source) -> (offset, drift), for the loaded pairs only
+        self.estimates = {}  # Same, worked out ahead of time (by the playlist), used once that pair is loaded
+        self.pending = {}  # Same keys -> future estimating it
+        self.poll_id = None
+        transport.listeners.append(self.update_offsets)
+
+    def update_offsets(self):
+        """Estimate whatever pair is missing, then shift each slot by its offset"""
+        sources = self.transport.file_slots()
+        reference = sources[0][1] if sources else None
+        pairs = {(reference, source) for _, source in sources}
+        self.results = {key: value for key, value in self.results.items() if key in pairs}
+        changed = False
+        with self.transport.held_notifications():
+            for slot, source in sources:
+                key = (reference, source)
+                offset, drift = 0, None
+                if self.enabled.get() and source is not reference:
+                    if key not in self.results and key in self.estimates:
+                        self.results[key] = self.estimates[key]
+                    if key in self.results:
+                        offset, drift = self.results[key]
+                    elif key not in self.pending and reference.complete and source.complete:
+                        self.pending[key] = LOADER_POOL.submit(estimate_alignment, reference, source)
+                changed |= offset != self.transport.offsets[slot]
+                self.transport.set_offset(slot, offset)
+                if slot < len(self.panels):
+                    self.panels[slot].drift = drift
+        if changed:
+            for panel in self.panels:
+                if panel.source:
+                    panel.refresh_info()
+        self.poll()
+
+    def poll(self):
+        """Pick up finished estimates on the Tk thread"""
+        if self.poll_id or not self.pending:
+            return
+        done = [key for key, future in self.pending.items() if future.done()]
+        for key in done:
+            future = self.pending.pop(key)
+            if future.exception():
+                messagebox.showerror("Error", f"Could not align sources:\n{future.exception()}")
+                self.enabled.set(False)
+            else:
+                self.results[key] = future.result()
+        if done:
+            self.update_offsets()  # Polls again for whatever is still pending
+        elif self.pending:
+            self.poll_id = self.after(LOAD_POLL_MS, self.repoll)
+
+    def repoll(self):
+        self.poll_id = None
+        self.poll()
+
 class AudioPanel:
-    def __init__(self, parent, label_text):
+    VIEW_MODES = ("Wave", "Spec", "Diff")  # Waveform, spectrogram, spectrum minus the other file's
+
+    def __init__(self, parent, label_text, transport):
+        self.init_state(label_text, transport)
+        transport.listeners.append(self.on_transport_change)
+
         # Updated panel size to fit the black areas, no border, and black background
         self.frame = tk.Frame(parent, width=PANEL_WIDTH, height=PANEL_HEIGHT,
                              relief=tk.FLAT, borderwidth=0, bg=COLOR_SCHEME["info_text_bg"]) # Changed relief, borderwidth, and bg
@@ -208,10 +2785,10 @@ class AudioPanel:
         self.label.pack(pady=2) # Reduced pady
 
         # Load icons
-        self.icon_load = ImageTk.PhotoImage(Image.open(os.path.join(ICON_DIR, "icon_eject.png")).resize((33, 40)))
-        self.icon_play = ImageTk.PhotoImage(Image.open(os.path.join(ICON_DIR, "icon_play.png")).resize((33, 40)))
-        self.icon_pause = ImageTk.PhotoImage(Image.open(os.path.join(ICON_DIR, "icon_pause.png")).resize((33, 40)))
-        self.icon_stop = ImageTk.PhotoImage(Image.open(os.path.join(ICON_DIR, "icon_stop.png")).resize((33, 40)))
+        self.icon_load = load_icon(os.path.join(ICON_DIR, "icon_eject.png"), (33, 40))
+        self.icon_play = load_icon(os.path.join(ICON_DIR, "icon_play.png"), (33, 40))
+        self.icon_pause = load_icon(os.path.join(ICON_DIR, "icon_pause.png"), (33, 40))
+        self.icon_stop = load_icon(os.path.join(ICON_DIR, "icon_stop.png"), (33, 40))
 
         self.load_button = tk.Button(self.frame, bg=COLOR_SCHEME["button_bg"], text="", image=self.icon_load,
                                    compound=tk.LEFT, command=self.load_audio, bd=0, highlightthickness=0)
@@ -220,26 +2797,223 @@ class AudioPanel:
         self.controls_frame = tk.Frame(self.frame, bg=COLOR_SCHEME["info_text_bg"]) # Changed bg here
         self.controls_frame.pack(pady=2) # Reduced pady
 
-        self.play_button = tk.Button(self.controls_frame, bg=COLOR_SCHEME["button_bg"], text="", image=self.icon_play,
-                                   compound=tk.LEFT, state=tk.DISABLED, command=self.play_audio, bd=0, highlightthickness=0)
-        self.play_button.pack(side=tk.LEFT, padx=5)
+        self.play_button = tk.Button(self.controls_frame, bg=COLOR_SCHEME["button_bg"], text="", image=self.icon_play,
+                                   compound=tk.LEFT, state=tk.DISABLED, command=self.play_audio, bd=0, highlightthickness=0)
+        self.play_button.pack(side=tk.LEFT, padx=5)
+
+        self.pause_button = tk.Button(self.controls_frame, bg=COLOR_SCHEME["button_bg"], text="", image=self.icon_pause,
+                                    compound=tk.LEFT, state=tk.DISABLED, command=self.pause_audio, bd=0, highlightthickness=0)
+        self.pause_button.pack(side=tk.LEFT, padx=5)
+
+        self.stop_button = tk.Button(self.controls_frame, bg=COLOR_SCHEME["button_bg"], text="", image=self.icon_stop,
+                                   compound=tk.LEFT, state=tk.DISABLED, command=self.stop_audio, bd=0, highlightthickness=0)
+        self.stop_button.pack(side=tk.LEFT, padx=5)
+
+        self.view_button = tk.Button(self.controls_frame, text=self.view_mode, width=4, command=self.cycle_view,
+                                     font=("NimbusSansNarrow-Bold", 8), bg=COLOR_SCHEME["button_bg"],
+                                     fg=COLOR_SCHEME["info_text_fg"], bd=0, highlightthickness=0)
+        self.view_button.pack(side=tk.LEFT, padx=5)
+
+        # Info text with custom background and text colors - adjusted size
+        self.info_text = tk.Text(self.frame, height=11, width=30, bg=COLOR_SCHEME["info_text_bg"], # Drastically reduced height
+                               fg=COLOR_SCHEME["info_text_fg"], font=("NimbusSansNarrow-Bold", 8)) # Adjusted font size
+        self.info_text.pack(pady=2) # Reduced pady
+
+        # The waveform plot is built by ensure_plot; an empty canvas holds its place until then
+        self.plot_placeholder = tk.Canvas(self.frame, width=PANEL_WIDTH - 20, height=100, bg=COLOR_SCHEME["waveform_bg"],
+                                          highlightthickness=0)
+        self.plot_placeholder.pack(pady=2)
+
+        # Add volume control
+        self.volume_control = VolumeControl(self.frame, command=self.set_volume, bg=COLOR_SCHEME["info_text_bg"]) # Changed bg here
+        self.volume_control.pack(pady=2) # Reduced pady
+
+        # Add LED meter - adjusted width for new panel size
+        self.led_meter = LEDMeter(self.frame, width=300, height=20, channels=2, bg=COLOR_SCHEME["info_text_bg"]) # Changed bg here
+        self.led_meter.pack(pady=2) # Reduced pady
+
+        # The meter and cursor are driven by the FrameScheduler's tick
+        self.led_meter.reset()  # Start with every segment off
+
+    def init_state(self, label_text, transport):
+        """Everything but the widgets, shared with the benchmark's OffscreenPanel"""
+        self.name = label_text
+        self.transport = transport
+        self.slot = transport.add_slot()
+        self.drift = None  # Drift against the reference in ppm, when aligned
+        self.view_mode = self.VIEW_MODES[0]
+        self.waveform_fig = self.waveform_ax = self.canvas = None  # Built by ensure_plot
+
+        # Audio state
+        self.source = None
+        self.load_job = None
+        self.load_poll_id = None
+        self.progress_line = None
+        self.waveform_background = None  # Cached waveform pixels for blitting the cursor
+        self.peaks = None
+        self.view_start = 0
+        self.view_end = 0
+        self.spectrogram_jobs = {}  # Source -> future computing its spectrogram
+        self.partial_drawn = 0.0    # When a streaming file's waveform was last redrawn
+        self.spectrogram_poll_id = None
+        self.loop_drag = None       # (anchor, current) frames while a loop region is being dragged
+        self.drag_span = None
+        self.loop_drawn = None      # Transport loop shown in the current drawing
+        self.plot_width = PANEL_WIDTH - 20
+        self.cursor_column = None   # Pixel column the cursor was last drawn at
+
+    def load_audio(self):
+        # Pressing eject while a file is loading cancels that load
+        if self.load_job:
+            self.cancel_load()
+            return
+        file_path = filedialog.askopenfilename(filetypes=[("Audio Files", AUDIO_FILE_PATTERNS)])
+        if file_path:
+            self.load_file(file_path)
+
+    def load_file(self, file_path):
+        """Decode `file_path` on the loader pool, replacing any load still running"""
+        if self.load_job:
+            self.cancel_load()
+        self.load_job = LoadJob(file_path)
+        self.load_job.future = LOADER_POOL.submit(load_source, file_path, self.load_job)
+        self.poll_load()
+
+    def poll_load(self):
+        """Show load progress and pick up the decoded result on the Tk thread"""
+        job = self.load_job
+        self.load_poll_id = None
+        if job is None:
+            return
+        if not job.future.done():
+            if job.partial is not None:
+                self.show_partial(job)
+            else:
+                self.info_text.delete(1.0, tk.END)
+                self.info_text.insert(tk.END, f"Loading {os.path.basename(job.path)}\n"
+                                              f"{job.message}... {int(job.fraction * 100)}%\n\n"
+                                              f"Press eject to cancel")
+            self.load_poll_id = self.frame.after(LOAD_POLL_MS, self.poll_load)
+            return
+
+        self.load_job = None
+        if job.cancelled:
+            return
+        try:
+            source = job.future.result()
+        except Exception as e:
+            self.info_text.delete(1.0, tk.END)
+            messagebox.showerror("Error", f"Could not load file:\n{e}")
+            return
+        target = self.conversion_target(source)
+        if target:
+            self.convert(source, target)
+            return
+        source.match_pending = self.others_streaming()
+        if source is self.source:
+            # Streamed: it has been playable all along, so only redraw it at its final length
+            self.display_info(source.path, source.metadata)
+            self.draw_waveform()
+            self.transport.notify()  # Loudness match and alignment can now measure it
+            return
+        self.set_source(source)
+
+    def conversion_target(self, source):
+        """(frame_rate, channels) a new file needs to match the first other loaded file, or None"""
+        for slot, other in self.transport.file_slots():
+            if slot != self.slot and other.complete and not other.match_pending:
+                return conversion_target(source, other)
+        return None
+
+    def others_streaming(self):
+        """True while another slot's file is still decoding, so its final format isn't settled"""
+        return any(not other.complete for slot, other in self.transport.file_slots() if slot != self.slot)
+
+    def convert(self, source, target):
+        """Bring the file to the format of the one already loaded, then pick it up in poll_load again"""
+        self.load_job = LoadJob(source.path)
+        self.load_job.future = LOADER_POOL.submit(convert_source, source, *target, self.load_job)
+        self.poll_load()
+
+    def show_partial(self, job):
+        """Show a streamed file while it decodes; it can already be played up to the decoded part"""
+        if self.source is not job.partial:
+            self.set_source(job.partial)
+            self.partial_drawn = time.perf_counter()
+        elif time.perf_counter() - self.partial_drawn >= STREAM_REDRAW_MS / 1000:
+            self.partial_drawn = time.perf_counter()
+            self.render_waveform()
+        self.display_info(job.partial.path, job.partial.metadata)
+        self.info_text.insert(tk.END, f"{job.message}... {int(job.fraction * 100)}% (eject cancels)\n")
 
-        self.pause_button = tk.Button(self.controls_frame, bg=COLOR_SCHEME["button_bg"], text="", image=self.icon_pause,
-                                    compound=tk.LEFT, state=tk.DISABLED, command=self.pause_audio, bd=0, highlightthickness=0)
-        self.pause_button.pack(side=tk.LEFT, padx=5)
+    def cancel_load(self):
+        """Abandon the running load and go back to the previously loaded file"""
+        if self.load_poll_id:
+            self.frame.after_cancel(self.load_poll_id)
+            self.load_poll_id = None
+        self.load_job.cancel()
+        self.load_job = None
+        self.info_text.delete(1.0, tk.END)
+        if self.source:
+            self.display_info(self.source.path, self.source.metadata)
 
-        self.stop_button = tk.Button(self.controls_frame, bg=COLOR_SCHEME["button_bg"], text="", image=self.icon_stop,
-                                   compound=tk.LEFT, state=tk.DISABLED, command=self.stop_audio, bd=0, highlightthickness=0)
-        self.stop_button.pack(side=tk.LEFT, padx=5)
+    def set_source(self, source):
+        """Swap in a freshly decoded file"""
+        self.stop_audio()
+        self.source = source
+        self.transport.set_source(self.slot, source)
+        self.peaks = source.peaks
+        self.display_info(source.path, source.metadata)
+        self.draw_waveform()
+        self.play_button.config(state=tk.NORMAL)
+        self.pause_button.config(state=tk.NORMAL)
+        self.stop_button.config(state=tk.NORMAL)
+        self.led_meter.reset(source.channels)  # One bar per channel
 
-        # Info text with custom background and text colors - adjusted size
-        self.info_text = tk.Text(self.frame, height=11, width=30, bg=COLOR_SCHEME["info_text_bg"], # Drastically reduced height
-                               fg=COLOR_SCHEME["info_text_fg"], font=("NimbusSansNarrow-Bold", 8)) # Adjusted font size
-        self.info_text.pack(pady=2) # Reduced pady
+    def display_info(self, file_path, metadata):
+        self.info_text.delete(1.0, tk.END)
+        info = f"File: {os.path.basename(file_path)}\n"
+        info += f"Format: {self.source.format}\n"
+        info += f"Duration: {round(self.source.duration_ms/1000, 2)} sec\n"
+        info += f"Sample Rate: {self.source.frame_rate} Hz\n"
+        info += f"Channels: {self.source.channels}\n"
+        origin = self.source.origin
+        if origin:
+            info += f"Converted from {origin['frame_rate']} Hz, {origin['channels']} ch\n"
+        if not self.source.complete and self.load_job is None:
+            info += "Partial: decoding was cancelled\n"
+        resident, mapped = self.source.memory_usage()
+        info += f"Memory: {format_bytes(resident)}"
+        info += f" (+ {format_bytes(mapped)} mapped from disk)\n" if mapped else "\n"
+        loudness = self.source.loudness
+        if loudness:
+            info += f"Loudness: {loudness['integrated']:.1f} LUFS\n"
+            info += f"Peak: {loudness['sample_peak']:.1f} dBFS, {loudness['true_peak']:.1f} dBTP\n"
+            match = self.transport.match_gains[self.slot]
+            if match != 1.0:
+                info += f"Level match: {20 * np.log10(match):+.1f} dB\n"
+        offset = self.transport.offsets[self.slot]
+        if offset:
+            info += f"Offset: {offset:+d} samples ({offset * 1000 / self.source.frame_rate:+.2f} ms)"
+            info += f", drift {self.drift:+.1f} ppm\n" if self.drift is not None else "\n"
+        if metadata:
+            for key, value in metadata.items():
+                info += f"{key.capitalize()}: {value}\n"
+        self.info_text.insert(tk.END, info)
+
+    def refresh_info(self):
+        """Redraw the info box, e.g. after a loudness measurement finishes"""
+        if self.load_job is None:
+            self.display_info(self.source.path, self.source.metadata)
 
-        # Configure waveform plot with custom background - adjusted size
+    def ensure_plot(self):
+        """Build the matplotlib waveform plot the first time it is needed"""
+        if self.canvas is not None:
+            return
+        Figure, FigureCanvasTkAgg = matplotlib_tk()
         # Set figsize to a reasonable aspect ratio, but primarily control size via the canvas widget's width/height
-        self.waveform_fig, self.waveform_ax = plt.subplots(figsize=(3, 1)) # Smaller figsize, but height config is key
+        self.waveform_fig = Figure(figsize=(3, 1)) # Smaller figsize, but height config is key
+        self.waveform_ax = self.waveform_fig.add_subplot()
         self.waveform_fig.patch.set_facecolor(COLOR_SCHEME["waveform_bg"])
         self.waveform_ax.set_facecolor(COLOR_SCHEME["waveform_bg"])
         # self.waveform_ax.tick_params(colors=COLOR_SCHEME["info_text_fg"])
@@ -251,221 +3025,944 @@ class AudioPanel:
         self.waveform_ax.title.set_color(COLOR_SCHEME["info_text_fg"]) # This was the old line
         # self.waveform_ax.set_title('Waveform') # Removed this line
 
-        self.canvas = FigureCanvasTkAgg(self.waveform_fig, master=self.frame)
+        self.attach_canvas(FigureCanvasTkAgg)
+
+    def attach_canvas(self, canvas_class):
+        """Put the figure on screen in place of the placeholder and follow the mouse on it"""
+        self.canvas = canvas_class(self.waveform_fig, master=self.frame)
         # Explicitly set the pixel width and height of the Tkinter canvas widget
         # This is critical for controlling the exact size.
         self.canvas.get_tk_widget().config(width=PANEL_WIDTH - 20, height=100) # **CRITICAL: Drastically reduced height**
-        self.canvas.get_tk_widget().pack(pady=2) # Reduced pady
+        self.canvas.get_tk_widget().pack(pady=2, after=self.plot_placeholder) # Reduced pady
+        self.plot_placeholder.destroy()
+        self.canvas.mpl_connect('scroll_event', self.on_waveform_scroll)
+        self.canvas.mpl_connect('draw_event', self.on_waveform_draw)
+        self.canvas.mpl_connect('button_press_event', self.on_waveform_press)
+        self.canvas.mpl_connect('motion_notify_event', self.on_waveform_drag)
+        self.canvas.mpl_connect('button_release_event', self.on_waveform_release)
 
-        # Add volume control
-        self.volume_control = VolumeControl(self.frame, bg=COLOR_SCHEME["info_text_bg"]) # Changed bg here
-        self.volume_control.pack(pady=2) # Reduced pady
+    def draw_waveform(self):
+        self.ensure_plot()
+        try:
+            self.progress_line = None
+            self.view_start = 0
+            self.view_end = self.peaks.length
+            self.render_waveform()
+        except Exception as e:
+            self.waveform_ax.clear()
+            # self.waveform_ax.set_title("Waveform unavailable") # Removed this line as well
 
-        # Add LED meter - adjusted width for new panel size
-        self.led_meter = LEDMeter(self.frame, width=300, height=20, bg=COLOR_SCHEME["info_text_bg"]) # Changed bg here
-        self.led_meter.pack(pady=2) # Reduced pady
+            # Restore colors after clearing
+            self.waveform_ax.set_facecolor(COLOR_SCHEME["waveform_bg"])
+            self.waveform_ax.title.set_color(COLOR_SCHEME["info_text_fg"])
 
-        # Audio state
-        self.audio = None
-        self.play_obj = None
-        self.is_paused = False
-        self.stop_flag = False
-        self.pause_position = 0
-        self.play_start_time = None
-        self.progress_line = None
-        self.samples = None
+            self.canvas.draw()
 
-        # Initialize LED meter animation
-        self.meter_update_id = None
-        self.progress_update_id = None # New: Store the after ID for progress
-        self.led_meter.set_level(0)  # Start with 0 level
+    def render_waveform(self):
+        """Draw the visible range from the peak pyramid level that fits the canvas"""
+        if self.peaks is None:
+            return
+        self.ensure_plot()
+        cursor = self.progress_line.get_xdata()[0] if self.progress_line else 0
+        width = self.canvas_width()
+        self.plot_width = width
+        self.cursor_column = None
+        self.waveform_ax.clear()
+        if self.view_mode == "Wave":
+            x, mins, maxs = self.peaks.view(self.view_start, self.view_end, width)
+            self.waveform_ax.fill_between(x, mins, maxs, color=COLOR_SCHEME["waveform_line"], linewidth=0.5)
+            self.waveform_ax.set_ylabel('Amplitude', fontsize=8) # Set font size here
+        else:
+            self.draw_spectrogram(width)
+        self.loop_drawn = self.transport.loop
+        self.drag_span = None
+        if self.loop_drawn:
+            start, end = (self.panel_frame(f) for f in self.loop_drawn)
+            self.waveform_ax.axvspan(start, end, color=COLOR_SCHEME["progress_line"], alpha=0.15, linewidth=0)
+        self.waveform_ax.set_xlim(self.view_start, self.view_end)
+        # self.waveform_ax.set_title('Waveform') # Removed this line to remove the title
+        self.waveform_ax.set_xlabel('Samples', fontsize=8) # Set font size here
 
-    def load_audio(self):
-        file_path = filedialog.askopenfilename(filetypes=[("Audio Files", "*.mp3 *.wav")])
-        if not file_path:
+        # Restore colors after clearing
+        self.waveform_ax.set_facecolor(COLOR_SCHEME["waveform_bg"])
+        self.waveform_ax.tick_params(colors=COLOR_SCHEME["info_text_fg"])
+        for spine in self.waveform_ax.spines.values():
+            spine.set_color(COLOR_SCHEME["info_text_fg"])
+        self.waveform_ax.xaxis.label.set_color(COLOR_SCHEME["info_text_fg"])
+        self.waveform_ax.yaxis.label.set_color(COLOR_SCHEME["info_text_fg"])
+        self.waveform_ax.title.set_color(COLOR_SCHEME["info_text_fg"])
+
+        # The cursor is animated so full redraws leave it out of the cached background
+        self.progress_line = self.waveform_ax.axvline(x=cursor, color=COLOR_SCHEME["progress_line"], animated=True)
+        self.canvas.draw()
+
+    def canvas_width(self):
+        """Pixel width of the waveform plot"""
+        width = self.canvas.get_tk_widget().winfo_width()
+        return width if width > 1 else PANEL_WIDTH - 20  # Widget not mapped yet
+
+    def cycle_view(self):
+        """Switch between the waveform, spectrogram and spectral difference views"""
+        self.view_mode = self.VIEW_MODES[(self.VIEW_MODES.index(self.view_mode) + 1) % len(self.VIEW_MODES)]
+        self.view_button.config(text=self.view_mode)
+        self.render_waveform()
+
+    def reference_slot(self):
+        """The first other loaded file, which the spectral difference view is measured against"""
+        for slot, _ in self.transport.file_slots():
+            if slot != self.slot:
+                return slot
+        return None
+
+    def draw_spectrogram(self, width):
+        """Draw the visible range as an image: this file's spectrogram, or it minus the reference's"""
+        sources = [self.source]
+        reference = self.reference_slot() if self.view_mode == "Diff" else None
+        if self.view_mode == "Diff":
+            if reference is None:
+                self.show_placeholder("Load another file to compare spectra")
+                return
+            sources.append(self.transport.sources[reference])
+
+        if not all(s.complete for s in sources):
+            self.show_placeholder("Spectrogram is available once decoding finishes")
+            return
+        missing = [s for s in sources if s.spectrogram is None]
+        for source in missing:
+            if source not in self.spectrogram_jobs:
+                self.spectrogram_jobs[source] = LOADER_POOL.submit(analyze_spectrogram, source)
+        if missing:
+            self.show_placeholder("Computing spectrogram...")
+            if self.spectrogram_poll_id is None:
+                self.spectrogram_poll_id = self.frame.after(LOAD_POLL_MS, self.poll_spectrograms)
+            return
+
+        frames = np.linspace(self.view_start, self.view_end, width, endpoint=False)
+        image = self.source.spectrogram.sample(frames)
+        extent = (self.view_start, self.view_end, 0, SPECTROGRAM_ROWS)
+        if reference is None:
+            self.waveform_ax.imshow(image, aspect="auto", origin="lower", extent=extent, cmap="magma",
+                                    vmin=SPECTROGRAM_FLOOR_DB, vmax=0, interpolation="nearest")
+        else:
+            # Same moment in the reference: undo this slot's offset, convert rates, apply the reference's
+            other = self.transport.sources[reference]
+            shared = frames - self.transport.offsets[self.slot]
+            other_frames = shared * other.frame_rate / self.source.frame_rate + self.transport.offsets[reference]
+            image = image - other.spectrogram.sample(other_frames.astype(np.int64))
+            self.waveform_ax.imshow(image, aspect="auto", origin="lower", extent=extent, cmap="RdBu_r",
+                                    vmin=-SPECTRAL_DIFF_RANGE_DB, vmax=SPECTRAL_DIFF_RANGE_DB,
+                                    interpolation="nearest")
+        ticks = [f for f in (100, 1000, 10000) if SPECTROGRAM_MIN_HZ < f < SPECTROGRAM_MAX_HZ]
+        rows = np.log(np.array(ticks) / SPECTROGRAM_MIN_HZ) / np.log(SPECTROGRAM_MAX_HZ / SPECTROGRAM_MIN_HZ)
+        self.waveform_ax.set_yticks(rows * SPECTROGRAM_ROWS, [f"{f // 1000}k" if f >= 1000 else str(f) for f in ticks])
+        self.waveform_ax.set_ylabel('Hz', fontsize=8)
+
+    def show_placeholder(self, message):
+        self.waveform_ax.text(0.5, 0.5, message, transform=self.waveform_ax.transAxes, ha="center", va="center",
+                              color=COLOR_SCHEME["info_text_fg"], fontsize=8)
+
+    def poll_spectrograms(self):
+        """Redraw once every spectrogram the current view needs has been computed"""
+        self.spectrogram_poll_id = None
+        if any(not future.done() for future in self.spectrogram_jobs.values()):
+            self.spectrogram_poll_id = self.frame.after(LOAD_POLL_MS, self.poll_spectrograms)
+            return
+        jobs, self.spectrogram_jobs = self.spectrogram_jobs, {}
+        for future in jobs.values():
+            if future.exception():
+                messagebox.showerror("Error", f"Could not compute the spectrogram:\n{future.exception()}")
+                return
+        if jobs and self.view_mode != "Wave" and self.peaks is not None:
+            self.render_waveform()
+
+    def on_waveform_draw(self, event):
+        """Cache the static waveform after every full redraw (load, zoom, resize)"""
+        self.waveform_background = self.canvas.copy_from_bbox(self.waveform_ax.bbox)
+        if self.progress_line:
+            self.waveform_ax.draw_artist(self.progress_line)
+
+    def draw_cursor(self, sample_index):
+        """Move the progress cursor by blitting it over the cached waveform background"""
+        if not self.progress_line:
+            return
+        self.progress_line.set_xdata([sample_index])
+        self.blit_overlays()
+
+    def blit_overlays(self):
+        """Draw the cursor and any loop being dragged over the cached waveform background"""
+        if self.waveform_background is None:
+            self.canvas.draw()
+            return
+        self.canvas.restore_region(self.waveform_background)
+        if self.drag_span:
+            self.waveform_ax.draw_artist(self.drag_span)
+        if self.progress_line:
+            self.waveform_ax.draw_artist(self.progress_line)
+        self.canvas.blit(self.waveform_ax.bbox)
+
+    def on_waveform_press(self, event):
+        """Start dragging out a loop region"""
+        if self.peaks is None or event.xdata is None or event.button != 1:
+            return
+        self.loop_drag = (event.xdata, event.xdata)
+
+    def on_waveform_drag(self, event):
+        if self.loop_drag is None or event.xdata is None:
+            return
+        self.loop_drag = (self.loop_drag[0], event.xdata)
+        if self.drag_span:
+            self.drag_span.remove()
+        self.drag_span = self.waveform_ax.axvspan(min(self.loop_drag), max(self.loop_drag), animated=True,
+                                                  color=COLOR_SCHEME["progress_line"], alpha=0.3, linewidth=0)
+        self.blit_overlays()
+
+    def on_waveform_release(self, event):
+        """Loop the dragged region on every source; a plain click clears the loop"""
+        if self.loop_drag is None:
             return
+        start, end = sorted(self.loop_drag)
+        self.loop_drag = None
+        if self.drag_span:
+            self.drag_span.remove()
+            self.drag_span = None
         try:
-            self.audio = AudioSegment.from_file(file_path)
-            metadata = MutagenFile(file_path, easy=True)
-            self.display_info(file_path, metadata)
-            self.draw_waveform()
-            self.play_button.config(state=tk.NORMAL)
-            self.pause_button.config(state=tk.NORMAL)
-            self.stop_button.config(state=tk.NORMAL)
-            self.pause_position = 0
-            self.led_meter.set_level(0)  # Reset meter
+            if (end - start) * 1000 / self.source.frame_rate < LOOP_MIN_MS:
+                self.transport.set_loop()
+            else:
+                self.transport.set_loop(self.shared_frame(start), self.shared_frame(end))
+        except ValueError:
+            self.transport.set_loop()  # Dragged entirely outside the audio
+
+    def set_view(self, start, end):
+        """Zoom the waveform to samples [start, end) without touching the raw samples"""
+        if self.peaks is None:
+            return
+        span = min(self.peaks.length, max(PEAK_BASE_BUCKET, int(end - start)))
+        start = min(max(0, int(start)), self.peaks.length - span)
+        self.view_start = start
+        self.view_end = start + span
+        self.render_waveform()
+
+    def on_waveform_scroll(self, event):
+        """Zoom in/out around the mouse position; with Shift held, scroll through the file instead"""
+        if self.peaks is None or event.xdata is None:
+            return
+        if event.key == "shift":
+            shift = (self.view_end - self.view_start) * (ZOOM_STEP - 1) / 2
+            shift = -shift if event.button == 'up' else shift
+            self.set_view(self.view_start + shift, self.view_end + shift)
+            return
+        scale = 1 / ZOOM_STEP if event.button == 'up' else ZOOM_STEP
+        start = event.xdata - (event.xdata - self.view_start) * scale
+        end = event.xdata + (self.view_end - event.xdata) * scale
+        self.set_view(start, end)
+
+    def play_audio(self):
+        """Play this panel's file; if the other panel is playing, switch to this one in place"""
+        if not self.source:
+            return
+
+        # The transport streams from the shared PCM; nothing is sliced or copied here
+        self.transport.set_gain(self.slot, self.volume_control.get_volume())
+        try:
+            self.transport.play(self.slot)
+        except ValueError as e:
+            messagebox.showwarning("Switch", f"Can't switch to this file:\n{e}")
         except Exception as e:
-            messagebox.showerror("Error", f"Could not load file:\n{e}")
+            messagebox.showerror("Error", f"Could not start playback:\n{e}")
+
+    def on_transport_change(self):
+        """Follow the shared transport: mark the audible panel and show the loop region"""
+        source = self.source
+        if source is not None and source.match_pending and self.load_job is None and not self.others_streaming():
+            # The file streaming when this one loaded has completed; match its format now
+            source.match_pending = False
+            target = self.conversion_target(source)
+            if target:
+                self.convert(source, target)
+        active = self.transport.active == self.slot and self.source is not None
+        self.label.config(text=f"\u25b6 {self.name}" if active else self.name)
+        if self.peaks is not None and self.transport.loop != self.loop_drawn:
+            self.render_waveform()
+
+    def tick(self, frame, playing, now):
+        """FrameScheduler tick: move the cursor and meter to the shared frame; True while playing"""
+        if self.source is None:
+            return False
+        sample = max(0, self.panel_frame(frame))
+        if sample >= self.source.frames:
+            sample, playing = 0, False  # This file has ended; the other may still be playing
+        self.update_progress_line(sample)
+        settling = self.update_led_meter(sample if playing else None, now)
+        return playing or settling
+
+    def current_frame(self):
+        """This panel's frame at the transport's audible position"""
+        return max(0, self.panel_frame(self.transport.playback_frame()))
+
+    def panel_frame(self, frame):
+        """This panel's frame for a frame of the transport's shared position"""
+        if self.transport.frame_rate and self.transport.frame_rate != self.source.frame_rate:
+            frame = frame * self.source.frame_rate // self.transport.frame_rate
+        return frame + self.transport.offsets[self.slot]
+
+    def shared_frame(self, frame):
+        """The transport's shared position for a frame of this panel"""
+        frame -= self.transport.offsets[self.slot]
+        if self.transport.frame_rate and self.transport.frame_rate != self.source.frame_rate:
+            frame = frame * self.transport.frame_rate // self.source.frame_rate
+        return frame
+
+    def set_volume(self, volume):
+        """Volume slider callback; the transport ramps to the new gain while playing"""
+        self.transport.set_gain(self.slot, volume)
+
+    def update_progress_line(self, sample_index):
+        """Blit the cursor only when it lands on a different pixel column"""
+        span = max(1, self.view_end - self.view_start)
+        column = int((sample_index - self.view_start) * self.plot_width // span)
+        if column != self.cursor_column:
+            self.cursor_column = column
+            self.draw_cursor(sample_index)
+
+    def update_led_meter(self, sample_index, now=None):
+        """Show the per-channel peak around `sample_index` (None lets the bars fall); True while settling"""
+        if sample_index is None:
+            return self.led_meter.set_level(0, now)
+
+        # Look up the precomputed per-channel peaks and map dBFS onto the meter scale
+        peak = self.source.envelope.level_at(sample_index)
+        db = 20 * np.log10(np.maximum(peak, 1e-10))
+        levels = np.clip((db - METER_FLOOR_DB) / -METER_FLOOR_DB * 100, 0, 100)
+
+        # The meter only recolors segments whose state changes
+        return self.led_meter.set_levels(levels.tolist(), now)
+
+    def pause_audio(self):
+        # Pausing and stopping act on the shared transport; every panel follows via on_transport_change
+        self.transport.pause()
+
+    def stop_audio(self):
+        self.transport.stop()
+
+
+class DifferencePanel(AudioPanel):
+    """A third panel, in its own window, that plays and draws A minus B as the null test"""
+    VIEW_MODES = ("Wave", "Spec")
+    def __init__(self, root, parent, transport, inputs):
+        self.window = tk.Toplevel(root)
+        self.window.title("Null test: A - B")
+        self.window.configure(bg=COLOR_SCHEME["panel_bg"])
+        self.window.protocol("WM_DELETE_WINDOW", self.hide)
+        self.window.withdraw()
+        super().__init__(self.window, "A - B", transport)
+        self.frame.pack(padx=10, pady=10)
+        self.load_button.pack_forget()  # Nothing to load; the inputs are the A and B panels
+
+        self.inputs = inputs
+        self.params = None
+        self.compute_job = None
+        self.next_refresh = 0.0  # perf_counter() after which the figures are updated again
+        self.drawn_fraction = 0.0
+        self.enabled = tk.BooleanVar(value=False)
+        self.toggle = tk.Checkbutton(parent, text="Null test (A - B)", variable=self.enabled,
+                                     command=self.set_enabled, font=("NimbusSansNarrow-Bold", 8),
+                                     bg=COLOR_SCHEME["info_text_bg"], fg=COLOR_SCHEME["info_text_fg"],
+                                     selectcolor=COLOR_SCHEME["info_text_bg"],
+                                     activebackground=COLOR_SCHEME["info_text_bg"], highlightthickness=0)
+
+    def set_enabled(self):
+        """Show the window and start following A and B, or tear the difference down"""
+        if self.enabled.get():
+            self.window.deiconify()
+            self.params = self.current_params()
+            self.rebuild()  # Its new source wakes the frame scheduler, whose ticks follow A and B from here
+            return
+        self.window.withdraw()
+        self.params = None
+        self.set_difference(None, "")
+
+    def hide(self):
+        """Closing the window turns the null test off"""
+        self.enabled.set(False)
+        self.set_enabled()
+
+    def current_params(self):
+        """Everything the difference depends on, or None until both inputs are loaded"""
+        a, b = (panel.source for panel in self.inputs)
+        if a is None or b is None or not (a.complete and b.complete):
+            return None
+        slots = [panel.slot for panel in self.inputs]
+        return (a, b, tuple(self.transport.offsets[s] for s in slots),
+                tuple(self.transport.match_gains[s] for s in slots))
+
+    def tick(self, frame, playing, now):
+        """FrameScheduler tick: rebuild when an input, gain or offset changes, and show progress while
+        computing or playing; True until the computation is done"""
+        if not self.enabled.get():
+            return False
+        params = self.current_params()
+        if params != self.params:
+            self.params = params
+            self.rebuild()
+        job = self.compute_job
+        finished = job is not None and job.future.done()
+        if finished:
+            self.compute_job = None
+            if not job.cancelled and job.future.exception():
+                messagebox.showerror("Error", f"Could not compute the difference:\n{job.future.exception()}")
+        if self.source and (job or playing) and (finished or now >= self.next_refresh):
+            self.next_refresh = now + NULL_WATCH_MS / 1000
+            if self.source.computed - self.drawn_fraction >= NULL_REDRAW_STEP or \
+                    (self.source.computed == 1.0 and self.drawn_fraction < 1.0):
+                self.drawn_fraction = self.source.computed
+                self.render_waveform()
+            self.refresh_info()
+        return super().tick(frame, playing, now) or self.compute_job is not None
+
+    def rebuild(self):
+        if self.params is None:
+            self.set_difference(None, "Load files into A and B to hear their difference")
+            return
+        a, b, offsets, gains = self.params
+        try:
+            source = DifferenceSource(a, b, offsets, gains)
+        except ValueError as e:
+            self.set_difference(None, f"Can't subtract B from A:\n{e}")
+            return
+        self.set_difference(source)
+
+    def set_difference(self, source, message=""):
+        """Swap in a new difference (or none) and start computing its peaks ahead of playback"""
+        if self.compute_job:
+            self.compute_job.cancel()
+            self.compute_job = None
+        if self.transport.active == self.slot:
+            self.transport.pause()
+        self.source = source
+        self.transport.set_source(self.slot, source)
+        self.peaks = source.peaks if source else None
+        self.drawn_fraction = 0.0
+        state = tk.NORMAL if source else tk.DISABLED
+        for button in (self.play_button, self.pause_button, self.stop_button):
+            button.config(state=state)
+        self.led_meter.reset(source.channels if source else None)
+        if source is None:
+            if self.canvas:  # The plot is only built once there is something to draw
+                self.waveform_ax.clear()
+                self.waveform_ax.set_facecolor(COLOR_SCHEME["waveform_bg"])
+                self.canvas.draw()
+            self.info_text.delete(1.0, tk.END)
+            self.info_text.insert(tk.END, message)
+            return
+        self.compute_job = LoadJob(source.path)
+        self.compute_job.future = LOADER_POOL.submit(source.precompute, self.compute_job,
+                                                     self.transport.playback_frame)
+        self.display_info(source.path, source.metadata)
+        self.draw_waveform()
 
     def display_info(self, file_path, metadata):
+        source = self.source
+        _, _, offsets, gains = self.params
+        info = "A minus B after level matching and alignment\n"
+        info += f"Duration: {round(source.duration_ms / 1000, 2)} sec\n"
+        info += f"Sample Rate: {source.frame_rate} Hz\n"
+        info += f"Channels: {source.channels}\n"
+        info += f"Gains: A {20 * np.log10(gains[0]):+.1f} dB, B {20 * np.log10(gains[1]):+.1f} dB\n"
+        info += f"Offsets: A {offsets[0]:+d}, B {offsets[1]:+d} samples\n"
+        if source.computed < 1.0:
+            info += f"Computed: {int(source.computed * 100)}%\n"
+        else:
+            info += f"Residual: {source.residual_db():.1f} dBFS RMS, "
+            info += f"peak {max(source.peak_dbfs(), -200.0):.1f} dBFS\n"
+            info += f"Null depth: {source.null_depth_db():.1f} dB below A\n"
+            if source.unmatched_ms:
+                info += f"Not overlapping: {source.unmatched_ms / 1000:.3f} sec (left out of the above)\n"
+        if self.transport.playing:
+            info += f"Residual now: {source.residual_db(self.current_frame()):.1f} dBFS\n"
         self.info_text.delete(1.0, tk.END)
-        info = f"File: {os.path.basename(file_path)}\n"
-        info += f"Format: {self.audio.format if hasattr(self.audio, 'format') else os.path.splitext(file_path)[1][1:]}\n"
-        info += f"Duration: {round(len(self.audio)/1000, 2)} sec\n"
-        info += f"Sample Rate: {self.audio.frame_rate} Hz\n"
-        info += f"Channels: {self.audio.channels}\n"
-        if metadata:
-            for key, value in metadata.items():
-                info += f"{key.capitalize()}: {value}\n"
         self.info_text.insert(tk.END, info)
 
-    def draw_waveform(self):
-        try:
-            self.samples = np.array(self.audio.get_array_of_samples())
-            if self.audio.channels == 2:
-                self.samples = self.samples.reshape((-1, 2))
-                self.samples = self.samples.mean(axis=1)
+    def close(self):
+        if self.compute_job:
+            self.compute_job.cancel()
 
-            self.waveform_ax.clear()
-            self.waveform_ax.plot(self.samples, color=COLOR_SCHEME["waveform_line"])
-            # self.waveform_ax.set_title('Waveform') # Removed this line to remove the title
-            self.waveform_ax.set_xlabel('Samples', fontsize=8) # Set font size here
-            self.waveform_ax.set_ylabel('Amplitude', fontsize=8) # Set font size here
+class AbxPanel:
+    """Blind ABX window; X is a transport slot mirroring A or B, so all three switch exactly alike"""
+    def __init__(self, root, parent, transport, panels):
+        self.name = "X"
+        self.transport = transport
+        self.panels = panels
+        self.slot = transport.add_slot()
+        self.session = None
 
-            # Restore colors after clearing
-            self.waveform_ax.set_facecolor(COLOR_SCHEME["waveform_bg"])
-            self.waveform_ax.tick_params(colors=COLOR_SCHEME["info_text_fg"])
-            for spine in self.waveform_ax.spines.values():
-                spine.set_color(COLOR_SCHEME["info_text_fg"])
-            self.waveform_ax.xaxis.label.set_color(COLOR_SCHEME["info_text_fg"])
-            self.waveform_ax.yaxis.label.set_color(COLOR_SCHEME["info_text_fg"])
-            self.waveform_ax.title.set_color(COLOR_SCHEME["info_text_fg"])
+        self.window = tk.Toplevel(root)
+        self.window.title("Blind ABX")
+        self.window.configure(bg=COLOR_SCHEME["panel_bg"])
+        self.window.protocol("WM_DELETE_WINDOW", self.hide)
+        self.window.withdraw()
+        style = {"font": ("NimbusSansNarrow-Bold", 9), "bg": COLOR_SCHEME["button_bg"],
+                 "fg": COLOR_SCHEME["info_text_fg"], "highlightthickness": 0}
 
-            self.progress_line = self.waveform_ax.axvline(x=0, color=COLOR_SCHEME["progress_line"])
-            self.canvas.draw()
+        self.status = tk.Label(self.window, text="", width=40, **style)
+        self.status.pack(padx=10, pady=5)
+        choices = tk.Frame(self.window, bg=COLOR_SCHEME["panel_bg"])
+        choices.pack(pady=5)
+        for name, slot in (("A", panels[0].slot), ("B", panels[1].slot), ("X", self.slot)):
+            tk.Button(choices, text=f"Play {name}", width=7, command=lambda slot=slot: self.play(slot),
+                      **style).pack(side=tk.LEFT, padx=3)
+            self.window.bind(name.lower(), lambda event, slot=slot: self.play(slot))
+        tk.Button(choices, text="Stop", width=7, command=transport.pause, **style).pack(side=tk.LEFT, padx=3)
+        answers = tk.Frame(self.window, bg=COLOR_SCHEME["panel_bg"])
+        answers.pack(pady=5)
+        self.answer_buttons = [tk.Button(answers, text=f"X is {name}", width=10, state=tk.DISABLED,
+                                         command=lambda name=name: self.answer(name), **style)
+                               for name in "AB"]
+        for button in self.answer_buttons:
+            button.pack(side=tk.LEFT, padx=3)
+        tk.Button(self.window, text="New session", command=self.start, **style).pack(pady=5)
+
+        self.enabled = tk.BooleanVar(value=False)
+        self.toggle = tk.Checkbutton(parent, text="Blind ABX", variable=self.enabled, command=self.set_enabled,
+                                     font=("NimbusSansNarrow-Bold", 8), bg=COLOR_SCHEME["info_text_bg"],
+                                     fg=COLOR_SCHEME["info_text_fg"], selectcolor=COLOR_SCHEME["info_text_bg"],
+                                     activebackground=COLOR_SCHEME["info_text_bg"], highlightthickness=0)
+
+    def set_enabled(self):
+        if self.enabled.get():
+            self.window.deiconify()
+            self.status.config(text="Load A and B, then start a session")
+            return
+        self.window.withdraw()
+        self.end_session()
+
+    def hide(self):
+        """Closing the window leaves ABX mode"""
+        self.enabled.set(False)
+        self.set_enabled()
+
+    def start(self):
+        a, b = (panel.source for panel in self.panels[:2])
+        if a is None or b is None or not (a.complete and b.complete):
+            messagebox.showwarning("ABX", "Load a file into both A and B first")
+            return
+        if a.frame_rate != b.frame_rate:
+            messagebox.showwarning("ABX", f"Sample rates differ ({a.frame_rate} Hz vs {b.frame_rate} Hz)")
+            return
+        self.end_session()
+        slots = [panel.slot for panel in self.panels[:2]]
+        try:
+            self.session = AbxSession(a=a.path, b=b.path,
+                                      match_gains_db=[20 * np.log10(self.transport.match_gains[s]) for s in slots],
+                                      offsets=[self.transport.offsets[s] for s in slots])
+        except OSError as e:
+            messagebox.showerror("Error", f"Could not create the ABX log:\n{e}")
+            return
+        for button in self.answer_buttons:
+            button.config(state=tk.NORMAL)
+        self.begin_trial()
+
+    def begin_trial(self):
+        # Never swap what X is while it is audible; that change alone would give X away
+        if self.transport.active == self.slot:
+            self.transport.switch(self.panels[0].slot)
+        target = self.panels[0] if self.session.x == "A" else self.panels[1]
+        self.transport.set_alias(self.slot, target.slot)
+        self.refresh()
+
+    def play(self, slot):
+        if self.session is None:
+            return
+        try:
+            if self.transport.playing:
+                self.transport.switch(slot)
+            else:
+                self.transport.play(slot)
+            self.session.switches += 1
+        except ValueError as e:
+            messagebox.showwarning("Switch", f"Can't switch source:\n{e}")
         except Exception as e:
-            self.waveform_ax.clear()
-            # self.waveform_ax.set_title("Waveform unavailable") # Removed this line as well
+            messagebox.showerror("Error", f"Could not start playback:\n{e}")
 
-            # Restore colors after clearing
-            self.waveform_ax.set_facecolor(COLOR_SCHEME["waveform_bg"])
-            self.waveform_ax.title.set_color(COLOR_SCHEME["info_text_fg"])
+    def answer(self, choice):
+        if self.session is None or self.session.finished:
+            return
+        self.session.answer(choice)
+        if self.session.finished:
+            for button in self.answer_buttons:
+                button.config(state=tk.DISABLED)
+            self.refresh()
+        else:
+            self.begin_trial()
 
-            self.canvas.draw()
+    def refresh(self):
+        session = self.session
+        if session is None:
+            return
+        if not session.finished:
+            self.status.config(text=f"Trial {len(session.results) + 1} of {session.trials}: which one is X?")
+            return
+        p = session.p_value()
+        verdict = "unlikely to be guessing" if p < 0.05 else "could be guessing"
+        self.status.config(text=f"{session.correct}/{session.trials} correct, p = {p:.3f} ({verdict})\n"
+                                f"Log: {session.log_path}")
 
-    def play_audio(self):
-        if not self.audio:
+    def end_session(self):
+        if self.session:
+            self.session.close()
+            self.session = None
+        if self.transport.active == self.slot:
+            self.transport.switch(self.panels[0].slot)  # A is loaded; the session needed it
+        self.transport.set_alias(self.slot, None)
+        for button in self.answer_buttons:
+            button.config(state=tk.DISABLED)
+
+    def close(self):
+        if self.session:
+            self.session.close()
+
+class LibraryPanel:
+    """Library window: search the indexed folders and load a result into any panel"""
+    def __init__(self, root, parent, panels):
+        self.panels = panels
+        self.library = None       # LibraryIndex, opened when the window is first shown
+        self.scan_job = None
+        self.scan_queue = []      # Folders waiting for their turn to be scanned
+        self.refreshed = 0.0      # When the results were last refreshed during a scan
+        self.thumbnails = {}      # (path, mtime_ns) -> PhotoImage of the stored peaks
+
+        self.window = tk.Toplevel(root)
+        self.window.title("Library")
+        self.window.configure(bg=COLOR_SCHEME["panel_bg"])
+        self.window.protocol("WM_DELETE_WINDOW", self.hide)
+        self.window.withdraw()
+        style = {"font": ("NimbusSansNarrow-Bold", 9), "bg": COLOR_SCHEME["button_bg"],
+                 "fg": COLOR_SCHEME["info_text_fg"], "highlightthickness": 0}
+
+        search = tk.Frame(self.window, bg=COLOR_SCHEME["panel_bg"])
+        search.pack(fill=tk.X, padx=10, pady=5)
+        self.query = tk.StringVar()
+        self.query.trace_add("write", lambda *args: self.refresh())  # Every keystroke searches again
+        entry = tk.Entry(search, textvariable=self.query, insertbackground=COLOR_SCHEME["info_text_fg"], **style)
+        entry.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        entry.focus_set()
+        self.format = tk.StringVar(value="All")
+        self.format_menu = tk.OptionMenu(search, self.format, "All")
+        self.format_menu.config(width=5, **style)
+        self.format_menu.pack(side=tk.LEFT, padx=3)
+        self.shown_formats = None
+        tk.Button(search, text="Add folder...", command=self.add_folder, **style).pack(side=tk.LEFT, padx=3)
+        tk.Button(search, text="Rescan", command=self.rescan, **style).pack(side=tk.LEFT, padx=3)
+
+        results = tk.Frame(self.window, bg=COLOR_SCHEME["panel_bg"])
+        results.pack(fill=tk.BOTH, expand=True, padx=10)
+        ttk.Style(self.window).configure("Library.Treeview", rowheight=LIBRARY_THUMB_HEIGHT + 4)
+        self.tree = ttk.Treeview(results, style="Library.Treeview", columns=("format", "length", "rate", "loudness"),
+                                 height=15, selectmode="browse")
+        for column, heading, width in (("#0", "File", LIBRARY_THUMB_WIDTH + 260), ("format", "Format", 60),
+                                       ("length", "Length", 60), ("rate", "Rate", 110), ("loudness", "Loudness", 90)):
+            self.tree.heading(column, text=heading)
+            self.tree.column(column, width=width, stretch=column == "#0")
+        scrollbar = tk.Scrollbar(results, command=self.tree.yview)
+        self.tree.config(yscrollcommand=scrollbar.set)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.pack(side=tk.LEFT, fill=tk.Y)
+        self.tree.bind("<Double-1>", lambda event: self.load_selected())
+        self.tree.bind("<Return>", lambda event: self.load_selected())
+
+        bottom = tk.Frame(self.window, bg=COLOR_SCHEME["panel_bg"])
+        bottom.pack(fill=tk.X, padx=10, pady=5)
+        self.target = tk.StringVar(value=panels[0].name)
+        target_menu = tk.OptionMenu(bottom, self.target, *[panel.name for panel in panels])
+        target_menu.config(width=2, **style)
+        target_menu.pack(side=tk.RIGHT)
+        tk.Button(bottom, text="Load into", command=self.load_selected, **style).pack(side=tk.RIGHT, padx=3)
+        self.status = tk.Label(bottom, text="", anchor=tk.W, **style)
+        self.status.pack(side=tk.LEFT, fill=tk.X, expand=True)
+
+        self.enabled = tk.BooleanVar(value=False)
+        self.toggle = tk.Checkbutton(parent, text="Library", variable=self.enabled, command=self.set_enabled,
+                                     font=("NimbusSansNarrow-Bold", 8), bg=COLOR_SCHEME["info_text_bg"],
+                                     fg=COLOR_SCHEME["info_text_fg"], selectcolor=COLOR_SCHEME["info_text_bg"],
+                                     activebackground=COLOR_SCHEME["info_text_bg"], highlightthickness=0)
+
+    def set_enabled(self):
+        if not self.enabled.get():
+            self.window.withdraw()
             return
-        if self.play_obj and self.play_obj.is_playing():
-            self.play_obj.stop()
+        if self.library is None:
+            try:
+                self.library = LibraryIndex()
+            except (OSError, sqlite3.Error) as e:
+                self.enabled.set(False)
+                messagebox.showerror("Error", f"Could not open the library:\n{e}")
+                return
+        self.window.deiconify()
+        self.refresh()
+        self.rescan()  # Cheap when nothing changed: only new and modified files are decoded
 
-        # Apply volume adjustment by creating a new segment
-        segment = self.audio[self.pause_position:]
+    def hide(self):
+        self.enabled.set(False)
+        self.set_enabled()
 
-        # Apply volume adjustment
-        volume_factor = self.volume_control.get_volume()
-        if volume_factor != 1.0:
-            segment = segment.apply_gain(20 * np.log10(volume_factor) if volume_factor > 0 else -100)
+    def add_folder(self):
+        if self.library is None:
+            return
+        folder = filedialog.askdirectory(parent=self.window, mustexist=True)
+        if not folder:
+            return
+        self.library.add_root(folder)
+        self.start_scan([os.path.abspath(folder)])
 
-        self.play_obj = sa.play_buffer(
-            segment.raw_data,
-            num_channels=segment.channels,
-            bytes_per_sample=segment.sample_width,
-            sample_rate=segment.frame_rate
-        )
+    def rescan(self):
+        if self.library is None:
+            return
+        roots = self.library.roots()
+        if not roots:
+            self.status.config(text="Add a folder to index its audio files")
+        # Folders that are not there right now (an unmounted drive) keep their entries
+        self.start_scan([root for root in roots if os.path.isdir(root)])
 
-        self.play_start_time = time.time()
-        self.stop_flag = False
-        self.is_paused = False
-        self.update_progress_line()
-        self.animate_led_meter()
+    def start_scan(self, roots):
+        self.scan_queue += [root for root in roots if root not in self.scan_queue]
+        if self.scan_job is None:
+            self.next_scan()
 
-    def update_progress_line(self):
-        if not self.play_obj or self.is_paused or self.stop_flag:
-            if self.progress_update_id:
-                self.frame.after_cancel(self.progress_update_id)
-                self.progress_update_id = None
+    def next_scan(self):
+        if not self.scan_queue:
             return
+        root = self.scan_queue.pop(0)
+        self.scan_job = LoadJob(root)
+        self.scan_job.future = LOADER_POOL.submit(self.library.scan, root, self.scan_job)
+        self.poll_scan()
 
-        elapsed = time.time() - self.play_start_time
-        current_ms = self.pause_position + int(elapsed * 1000)
+    def poll_scan(self):
+        """Show scan progress, with the results refreshed as files are indexed"""
+        job = self.scan_job
+        if job is None:
+            return
+        if not job.future.done():
+            self.status.config(text=f"{os.path.basename(job.path)}: {job.message}... {int(job.fraction * 100)}%")
+            if time.perf_counter() - self.refreshed >= LIBRARY_REFRESH_MS / 1000:
+                self.refresh()
+            self.window.after(LOAD_POLL_MS, self.poll_scan)
+            return
 
-        if current_ms >= len(self.audio):
-            self.progress_line.set_xdata([0])
-            self.canvas.draw()
+        self.scan_job = None
+        if job.cancelled:
             return
+        try:
+            indexed, removed, failed = job.future.result()
+        except Exception as e:
+            self.status.config(text="")
+            messagebox.showerror("Error", f"Could not scan {job.path}:\n{e}")
+        else:
+            summary = f"{os.path.basename(job.path)}: {indexed} indexed, {removed} removed"
+            self.status.config(text=summary + (f", {failed} unreadable" if failed else ""))
+        self.refresh()
+        self.next_scan()
 
-        sample_index = int(current_ms * self.audio.frame_rate / 1000)
-        self.progress_line.set_xdata([sample_index])
-        self.canvas.draw()
-        self.progress_update_id = self.frame.after(100, self.update_progress_line) # Store the ID here
+    def refresh(self):
+        """List what matches the search box and format filter, straight from the index"""
+        if self.library is None:
+            return
+        self.refreshed = time.perf_counter()
+        selection = self.tree.selection()
+        self.tree.delete(*self.tree.get_children())
+        if len(self.thumbnails) > 4 * LIBRARY_SEARCH_LIMIT:
+            self.thumbnails.clear()  # None of them is shown any more
+        format = self.format.get()
+        for row in self.library.search(self.query.get(), None if format == "All" else format):
+            duration = row["duration_s"]
+            loudness = row["loudness_lufs"]
+            self.tree.insert("", tk.END, iid=row["path"], text=row["name"], image=self.thumbnail(row),
+                             values=(row["format"], f"{int(duration // 60)}:{int(duration % 60):02d}",
+                                     f"{row['frame_rate']} Hz, {row['channels']} ch",
+                                     "" if loudness is None else f"{loudness:.1f} LUFS"))
+        kept = [path for path in selection if self.tree.exists(path)]
+        if kept:
+            self.tree.selection_set(kept)
+        self.update_formats()
 
-    def animate_led_meter(self):
-        """Animate the LED meter during playback"""
-        if not self.play_obj or self.is_paused or self.stop_flag:
-            if self.meter_update_id:
-                self.frame.after_cancel(self.meter_update_id)
-                self.meter_update_id = None
-            self.led_meter.set_level(0)
+    def update_formats(self):
+        formats = ["All"] + self.library.formats()
+        if formats == self.shown_formats:
             return
+        self.shown_formats = formats
+        menu = self.format_menu["menu"]
+        menu.delete(0, tk.END)
+        for format in formats:
+            menu.add_command(label=format, command=lambda format=format: (self.format.set(format), self.refresh()))
 
-        # Calculate current position in audio
-        elapsed = time.time() - self.play_start_time
-        current_ms = self.pause_position + int(elapsed * 1000)
+    def thumbnail(self, row):
+        key = (row["path"], row["mtime_ns"])
+        if key not in self.thumbnails:
+            self.thumbnails[key] = ImageTk.PhotoImage(thumbnail_image(row["thumbnail"]), master=self.window)
+        return self.thumbnails[key]
 
-        if current_ms >= len(self.audio):
-            self.led_meter.set_level(0)
+    def load_selected(self):
+        selection = self.tree.selection()
+        if not selection:
             return
+        path = selection[0]
+        if not os.path.isfile(path):
+            messagebox.showwarning("Library", f"{path} is gone; rescan to update the library")
+            return
+        panel = next(panel for panel in self.panels if panel.name == self.target.get())
+        panel.load_file(path)
 
-        # Calculate sample index range for current time window
-        window_ms = 100  # 100ms window for amplitude calculation
-        sample_rate = self.audio.frame_rate
-        start_sample = int((current_ms - window_ms if current_ms > window_ms else 0) * sample_rate / 1000)
-        end_sample = int(current_ms * sample_rate / 1000)
+    def close(self):
+        self.scan_queue.clear()
+        if self.scan_job:
+            self.scan_job.cancel()
+        if self.library:
+            self.library.close()
 
-        # Get amplitude from samples if available
-        level = 0
-        if self.samples is not None and start_sample < len(self.samples) and end_sample <= len(self.samples):
-            window_samples = self.samples[start_sample:end_sample]
-            if len(window_samples) > 0:
-                # Normalize to 0-100 range - adjust these values based on your audio dynamics
-                max_amp = np.max(np.abs(window_samples))
-                normalized_amp = min(100, max_amp / 32768 * 100)  # Assuming 16-bit audio
+class PlaylistPanel:
+    """Playlist window: steps A and B through a list of pairs, each prepared before it is reached"""
+    MARKS = {"ready": "\u2713", "failed": "\u2717", "preparing": "\u2026", None: " "}
 
-                # Apply some smoothing
-                level = normalized_amp
+    def __init__(self, root, parent, transport, panels, time_align):
+        self.transport = transport
+        self.panels = panels
+        self.time_align = time_align
+        self.playlist = None
+        self.waiting = None       # Pair to show as soon as it is ready
+        self.poll_id = None
+        self.labels = []
 
-        # Add some randomness for visual effect if level is too low
-        if level < 5 and self.play_obj.is_playing():
-            level = np.random.randint(5, 15)
+        self.window = tk.Toplevel(root)
+        self.window.title("Playlist")
+        self.window.configure(bg=COLOR_SCHEME["panel_bg"])
+        self.window.protocol("WM_DELETE_WINDOW", self.hide)
+        self.window.withdraw()
+        style = {"font": ("NimbusSansNarrow-Bold", 9), "bg": COLOR_SCHEME["button_bg"],
+                 "fg": COLOR_SCHEME["info_text_fg"], "highlightthickness": 0}
 
-        # Set the meter level
-        self.led_meter.set_level(level)
+        self.listbox = tk.Listbox(self.window, width=70, height=15, activestyle=tk.NONE,
+                                  selectbackground=COLOR_SCHEME["info_text_fg"], **style)
+        self.listbox.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+        self.listbox.bind("<Double-1>", lambda event: self.go(self.listbox.nearest(event.y)))
+        buttons = tk.Frame(self.window, bg=COLOR_SCHEME["panel_bg"])
+        buttons.pack(pady=5)
+        tk.Button(buttons, text="Open...", command=self.choose, **style).pack(side=tk.LEFT, padx=3)
+        tk.Button(buttons, text="Previous", command=lambda: self.step(-1), **style).pack(side=tk.LEFT, padx=3)
+        tk.Button(buttons, text="Next", command=lambda: self.step(1), **style).pack(side=tk.LEFT, padx=3)
+        self.status = tk.Label(self.window, text="Open a CSV of pairs (reference,candidate per line)", **style)
+        self.status.pack(padx=10, pady=5)
+        for window in (root, self.window):
+            window.bind("<Next>", lambda event: self.step(1))    # Page Down
+            window.bind("<Prior>", lambda event: self.step(-1))  # Page Up
 
-        # Schedule next update
-        self.meter_update_id = self.frame.after(50, self.animate_led_meter)
+        self.enabled = tk.BooleanVar(value=False)
+        self.toggle = tk.Checkbutton(parent, text="Playlist", variable=self.enabled, command=self.set_enabled,
+                                     font=("NimbusSansNarrow-Bold", 8), bg=COLOR_SCHEME["info_text_bg"],
+                                     fg=COLOR_SCHEME["info_text_fg"], selectcolor=COLOR_SCHEME["info_text_bg"],
+                                     activebackground=COLOR_SCHEME["info_text_bg"], highlightthickness=0)
 
-    def pause_audio(self):
-        if self.play_obj and self.play_obj.is_playing():
-            self.play_obj.stop()
-            elapsed = time.time() - self.play_start_time
-            self.pause_position += int(elapsed * 1000)
-            self.is_paused = True
-            if self.meter_update_id:
-                self.frame.after_cancel(self.meter_update_id)
-                self.meter_update_id = None
-            if self.progress_update_id:
-                self.frame.after_cancel(self.progress_update_id)
-                self.progress_update_id = None
+    def set_enabled(self):
+        if self.enabled.get():
+            self.window.deiconify()
+        else:
+            self.window.withdraw()
 
+    def hide(self):
+        """Closing the window only hides it; the playlist and Page Up/Down keep working"""
+        self.enabled.set(False)
+        self.set_enabled()
 
-    def stop_audio(self):
-        self.stop_flag = True
-        if self.play_obj and self.play_obj.is_playing():
-            self.play_obj.stop()
-        self.pause_position = 0
-        self.is_paused = False
-        if self.progress_line:
-            self.progress_line.set_xdata([0])
-            self.canvas.draw()
-        self.led_meter.set_level(0)
-        if self.meter_update_id:
-            self.frame.after_cancel(self.meter_update_id)
-            self.meter_update_id = None
-        if self.progress_update_id: # Cancel on stop
-            self.frame.after_cancel(self.progress_update_id)
-            self.progress_update_id = None
+    def choose(self):
+        path = filedialog.askopenfilename(parent=self.window, filetypes=[("Pair lists", "*.csv"), ("All files", "*")])
+        if path:
+            self.open(path)
+
+    def open(self, manifest):
+        try:
+            pairs = read_manifest(manifest)
+        except (OSError, ValueError, UnicodeDecodeError) as e:
+            messagebox.showerror("Error", f"Could not read the playlist:\n{e}")
+            return
+        if not pairs:
+            messagebox.showwarning("Playlist", f"{manifest} has no pairs")
+            return
+        if self.playlist:
+            self.playlist.close()
+        self.playlist = Playlist(pairs)
+        self.labels = []
+        self.listbox.delete(0, tk.END)
+        self.enabled.set(True)
+        self.set_enabled()
+        self.go(0)
+
+    def step(self, delta):
+        if self.playlist:
+            target = (self.waiting if self.waiting is not None else self.playlist.current) + delta
+            if 0 <= target < len(self.playlist.pairs):
+                self.go(target)
+
+    def go(self, index):
+        """Move to pair `index`: shown at once if it was prepared, otherwise as soon as it is"""
+        if self.playlist is None or not 0 <= index < len(self.playlist.pairs):
+            return
+        self.playlist.current = index
+        self.playlist.update()
+        self.waiting = index
+        self.poll()
+
+    def poll(self):
+        """Show the awaited pair once it is ready and keep the prefetch going while anything is pending"""
+        if self.poll_id:
+            self.window.after_cancel(self.poll_id)
+            self.poll_id = None
+        playlist = self.playlist
+        if playlist is None:
+            return
+        if self.waiting is not None and playlist.state(self.waiting) in ("ready", "failed"):
+            index, self.waiting = self.waiting, None
+            self.show(index)
+        playlist.update()  # A finished pair may leave budget for the next one
+        self.refresh()
+        if self.waiting is not None or playlist.busy:
+            self.poll_id = self.window.after(LOAD_POLL_MS, self.poll)
+
+    def show(self, index):
+        job = self.playlist.jobs[index]
+        if job.future.exception():
+            messagebox.showerror("Error", f"Could not prepare pair {index + 1}:\n{job.future.exception()}")
+            return
+        a, b, alignment = job.future.result()
+        self.time_align.estimates = {(a, b): alignment}
+        for panel in self.panels[:2]:
+            if panel.load_job:
+                panel.cancel_load()
+        # Both files change together, so nothing measures or aligns the new A against the old B
+        with self.transport.held_notifications():
+            self.panels[0].set_source(a)
+            self.panels[1].set_source(b)
+
+    def refresh(self):
+        playlist = self.playlist
+        for index, (a, b) in enumerate(playlist.pairs):
+            current = "\u25b6" if index == playlist.current else " "
+            mark = self.MARKS[playlist.state(index)]
+            label = f"{current} {mark} {index + 1}. {os.path.basename(a)}  vs  {os.path.basename(b)}"
+            if index >= len(self.labels):
+                self.labels.append(label)
+                self.listbox.insert(tk.END, label)
+            elif self.labels[index] != label:
+                self.labels[index] = label
+                self.listbox.delete(index)
+                self.listbox.insert(index, label)
+        job = playlist.jobs.get(playlist.current)
+        position = f"Pair {playlist.current + 1} of {len(playlist.pairs)}"
+        if self.waiting is not None and job:
+            self.status.config(text=f"{position}: {job.message}... {int(job.fraction * 100)}%")
+        else:
+            self.status.config(text=f"{position} (Page Up/Down to step)")
 
+    def close(self):
+        if self.playlist:
+            self.playlist.close()
 
 class AnimatedGIF:
     def __init__(self, parent, gif_path, canvas=None, x=0, y=0, width=None, height=None):
@@ -481,7 +3978,7 @@ class AnimatedGIF:
         self.frame_index = 0
         self.canvas_item = None
         self.is_running = False
-        self.after_id = None # New: Store the after ID
+        self.next_frame_time = 0.0  # When the FrameScheduler should show the next frame
 
         try:
             # Load the GIF and prepare frames
@@ -534,9 +4031,8 @@ class AnimatedGIF:
                                      borderwidth=0, highlightthickness=0)
                 self.label.place(x=self.x, y=self.y)
 
-            # Start animation
+            # Frames advance on the FrameScheduler's tick while audio plays
             self.is_running = True
-            self.animate()
 
     def create_placeholder(self):
         """Create a placeholder if GIF can't be loaded"""
@@ -575,10 +4071,13 @@ class AnimatedGIF:
                                  borderwidth=0, highlightthickness=0)
             self.label.place(x=self.x, y=self.y)
 
-    def animate(self):
-        """Cycle through the frames to create animation"""
-        if not self.is_running:
-            return
+    def tick(self, frame, playing, now):
+        """FrameScheduler tick: the cassette turns while audio plays; True while it does"""
+        if not (self.is_running and playing and len(self.frames) > 1):
+            return False
+        if now < self.next_frame_time:
+            return True
+        self.next_frame_time = now + self.delay / 1000
 
         # Move to next frame
         self.frame_index = (self.frame_index + 1) % len(self.frames)
@@ -589,22 +4088,15 @@ class AnimatedGIF:
             self.canvas.itemconfig(self.canvas_item, image=current_frame)
         else:
             self.label.configure(image=current_frame)
-
-        # Schedule the next frame
-        self.after_id = self.parent.after(self.delay, self.animate) # Store the ID here
+        return True
 
     def stop(self):
         """Stop the animation"""
         self.is_running = False
-        if self.after_id: # Cancel the scheduled call if it exists
-            self.parent.after_cancel(self.after_id)
-            self.after_id = None
 
     def start(self):
         """Start or restart the animation"""
-        if not self.is_running:
-            self.is_running = True
-            self.animate()
+        self.is_running = True
 
 
 def setup_background(root):
@@ -614,19 +4106,8 @@ def setup_background(root):
 
     if USE_BACKGROUND_IMAGE:
         try:
-            # Load and process the background image
-            bg_img = Image.open(BACKGROUND_IMAGE_PATH)
-
-            # Resize if needed
-            if bg_img.width != BACKGROUND_WIDTH or bg_img.height != BACKGROUND_HEIGHT:
-                bg_img = bg_img.resize((BACKGROUND_WIDTH, BACKGROUND_HEIGHT))
-
-            # Apply transparency if needed
-            if BACKGROUND_ALPHA < 1.0:
-                bg_img = bg_img.convert("RGBA")
-                data = np.array(bg_img)
-                data[..., 3] = data[..., 3] * BACKGROUND_ALPHA
-                bg_img = Image.fromarray(data)
+            # Load the background resized and with transparency applied; cached after the first launch
+            bg_img = scaled_image(BACKGROUND_IMAGE_PATH, (BACKGROUND_WIDTH, BACKGROUND_HEIGHT), BACKGROUND_ALPHA)
 
             # Convert to PhotoImage for Tkinter
             bg_photo = ImageTk.PhotoImage(bg_img)
@@ -656,20 +4137,403 @@ def setup_background(root):
     return None
 
 
+BATCH_FIELDS = ["a", "b", "duration_a_s", "duration_b_s", "duration_diff_s",
+                "loudness_a_lufs", "loudness_b_lufs", "level_diff_db", "peak_a_dbfs", "peak_b_dbfs",
+                "offset_samples", "offset_ms", "drift_ppm", "null_rms_dbfs", "null_peak_dbfs", "null_depth_db",
+                "null_unmatched_s"]
+BATCH_FIELDS += [f"band_{centre:g}hz_diff_db" for centre in SPECTRUM_BANDS] + ["error"]
+
+def compare_pair(path_a, path_b):
+    """Every batch measurement for one pair, with B judged against A; runs in a worker process"""
+    # Batches are one-off runs over many files, which would otherwise flood the decode cache
+    a, b = load_source(path_a, cache=False), load_source(path_b, cache=False)
+    target = conversion_target(b, a)
+    if target:
+        b = convert_source(b, *target, cache=False)
+    loudness_a, loudness_b = analyze_loudness(a), analyze_loudness(b)
+    offset, drift = estimate_alignment(a, b)
+    result = {"a": path_a, "b": path_b,
+              "duration_a_s": a.duration_ms / 1000, "duration_b_s": b.duration_ms / 1000,
+              "duration_diff_s": (b.duration_ms - a.duration_ms) / 1000,
+              "loudness_a_lufs": loudness_a["integrated"], "loudness_b_lufs": loudness_b["integrated"],
+              "level_diff_db": loudness_b["integrated"] - loudness_a["integrated"],
+              "peak_a_dbfs": loudness_a["sample_peak"], "peak_b_dbfs": loudness_b["sample_peak"],
+              "offset_samples": offset, "offset_ms": offset * 1000 / b.frame_rate, "drift_ppm": drift}
+
+    # Null the pair the way the null test window does: loudness matched and aligned
+    try:
+        gains = matched_gains([loudness_a["integrated"], loudness_b["integrated"]])
+        difference = DifferenceSource(a, b, (0, offset), gains)
+    except ValueError as e:
+        result["error"] = f"No null test: {e}"
+    else:
+        difference.precompute(LoadJob(difference.path), lambda: 0)
+        result["null_peak_dbfs"] = difference.peak_dbfs()
+        result["null_rms_dbfs"] = difference.residual_db()
+        result["null_depth_db"] = difference.null_depth_db()
+        result["null_unmatched_s"] = difference.unmatched_ms / 1000
+
+    bands_a, bands_b = band_levels(a), band_levels(b)
+    for centre in SPECTRUM_BANDS:
+        if bands_a[centre] is not None and bands_b[centre] is not None:
+            result[f"band_{centre:g}hz_diff_db"] = bands_b[centre] - bands_a[centre]
+    return result
+
+def read_manifest(path):
+    """(a, b) pairs from a CSV manifest, one per line; relative paths start at the manifest's folder"""
+    base = os.path.dirname(os.path.abspath(path))
+    pairs = []
+    with open(path, newline="") as f:
+        for number, row in enumerate(csv.reader(f), 1):
+            row = [cell.strip() for cell in row]
+            if not row or not row[0] or row[0].startswith("#"):
+                continue
+            if len(row) < 2 or not row[1]:
+                raise ValueError(f"{path}:{number}: expected two comma-separated paths")
+            pairs.append((os.path.join(base, row[0]), os.path.join(base, row[1])))
+    return pairs
+
+def run_batch(manifest, output=None, workers=BATCH_WORKERS):
+    """Compare every pair in `manifest` across worker processes, writing each result as it finishes"""
+    pairs = read_manifest(manifest)
+    as_csv = bool(output) and output.lower().endswith(".csv")
+    out = open(output, "w", newline="") if output else sys.stdout
+    writer = csv.DictWriter(out, BATCH_FIELDS) if as_csv else None
+    if writer:
+        writer.writeheader()
+    failures = 0
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(compare_pair, a, b): (a, b) for a, b in pairs}
+            for done, future in enumerate(as_completed(futures), 1):
+                a, b = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {"a": a, "b": b, "error": str(e)}
+                    failures += 1
+                # Silence measures -inf dB, which JSON can't hold; leave those fields empty instead
+                result = {key: None if isinstance(value, float) and not np.isfinite(value) else value
+                          for key, value in result.items()}
+                if writer:
+                    writer.writerow(result)
+                else:
+                    out.write(json.dumps(result) + "\n")
+                out.flush()
+                summary = result.get("error") or f"null depth {result.get('null_depth_db')} dB"
+                print(f"[{done}/{len(pairs)}] {os.path.basename(a)} vs {os.path.basename(b)}: {summary}",
+                      file=sys.stderr)
+    finally:
+        if output:
+            out.close()
+    return 1 if failures else 0
+
+def run_scan(folders, workers=LIBRARY_WORKERS):
+    """Add `folders` to the library and bring their entries up to date"""
+    library = LibraryIndex()
+    failures = 0
+    try:
+        for folder in folders:
+            library.add_root(folder)
+            indexed, removed, failed = library.scan(folder, workers=workers)
+            failures += failed
+            print(f"{folder}: {indexed} indexed, {removed} removed, {failed} unreadable", file=sys.stderr)
+    finally:
+        library.close()
+    return 1 if failures else 0
+
+class OffscreenCanvas(tk.Canvas):
+    """Stands in for a Tk canvas without a display: items are remembered, never drawn"""
+    def __init__(self, parent=None, **kwargs):
+        self.item_options = {}
+
+    def create_rectangle(self, *coords, **options):
+        item = len(self.item_options) + 1
+        self.item_options[item] = options
+        return item
+
+    def itemconfig(self, item, **options):
+        self.item_options[item].update(options)
+
+    def delete(self, *items):
+        self.item_options.clear()  # LEDMeter only ever deletes everything
+
+class OffscreenMeter(LEDMeter, OffscreenCanvas):
+    """LEDMeter with its ballistics and segment bookkeeping intact, on an OffscreenCanvas"""
+
+class OffscreenPanel(AudioPanel):
+    """AudioPanel drawing through matplotlib's Agg canvas, with no window, for --benchmark"""
+    def __init__(self, label_text, transport):
+        self.init_state(label_text, transport)
+        self.volume_control = types.SimpleNamespace(get_volume=lambda: 1.0)  # Full volume, as the slider starts
+        self.led_meter = OffscreenMeter(None, width=300, height=20, channels=2)
+
+    def attach_canvas(self, canvas_class):
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        self.canvas = FigureCanvasAgg(self.waveform_fig)
+        dpi = self.waveform_fig.dpi
+        self.waveform_fig.set_size_inches((PANEL_WIDTH - 20) / dpi, 100 / dpi)  # The on-screen plot's size
+        self.canvas.mpl_connect('draw_event', self.on_waveform_draw)
+
+    def canvas_width(self):
+        return PANEL_WIDTH - 20
+
+    def set_source(self, source):
+        self.source = source
+        self.transport.set_source(self.slot, source)
+        self.peaks = source.peaks
+        self.led_meter.reset(source.channels)
+
+def write_test_wav(path, seconds, frame_rate, sample_width, channels=BENCHMARK_CHANNELS):
+    """A synthetic WAV, a pulsing tone over noise, written a second at a time"""
+    rng = np.random.default_rng(0)
+    full_scale = 2 ** (8 * sample_width - 1) - 1
+    with wave.open(path, "wb") as w:
+        w.setnchannels(channels)
+        w.setsampwidth(sample_width)
+        w.setframerate(frame_rate)
+        for second in range(seconds):
+            t = second + np.arange(frame_rate) / frame_rate
+            tone = 0.4 * np.sin(2 * np.pi * 440 * t) * (0.5 + 0.5 * np.sin(2 * np.pi * 0.7 * t))  # Keeps meters busy
+            block = np.clip(tone[:, np.newaxis] + 0.05 * rng.standard_normal((frame_rate, channels)), -1, 1)
+            ints = (block * full_scale).astype("<i4")
+            if sample_width == 3:
+                w.writeframes(ints.view(np.uint8).reshape(-1, 4)[:, :3].tobytes())
+            else:
+                w.writeframes(ints.astype({2: "<i2", 4: "<i4"}[sample_width]).tobytes())
+
+def timing_stats(name, seconds):
+    """Mean, 99th percentile and worst of a list of durations, in ms"""
+    if not seconds:
+        return {}
+    values = np.array(seconds) * 1000
+    return {f"{name}_mean_ms": round(float(values.mean()), 3),
+            f"{name}_p99_ms": round(float(np.percentile(values, 99)), 3),
+            f"{name}_max_ms": round(float(values.max()), 3)}
+
+def peak_rss_mb():
+    """Peak resident memory of this process so far, or None without the resource module"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / 1024 ** (2 if sys.platform == "darwin" else 1), 1)  # Bytes on macOS, KB elsewhere
+
+def benchmark_case(path):
+    """Time each stage for one test file; runs in a fresh process, so the peak memory is this file's"""
+    result = {"file_mb": round(os.path.getsize(path) / 1024 ** 2, 1), "baseline_rss_mb": peak_rss_mb()}
+    cache = DecodeCache(os.path.join(os.path.dirname(path), "cache"))
+
+    started = time.perf_counter()
+    load_source(path, cache=cache)  # Decodes, measures and fills the (empty) cache; dropped right away
+    result["decode_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    started = time.perf_counter()
+    source = load_source(path, cache=cache)
+    result["cached_load_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    started = time.perf_counter()
+    analyze_loudness(source)
+    result["loudness_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+    # Two panels on one transport, as in the window; both hold the file, so switching always works
+    backend = NullBackend()
+    transport = Transport(backend)
+    panels = [OffscreenPanel(name, transport) for name in "AB"]
+    for panel in panels:
+        panel.set_source(source)
+    panel = panels[0]
+
+    started = time.perf_counter()
+    panel.draw_waveform()  # Also imports matplotlib and builds the figure, as the first file loaded does
+    result["first_draw_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    durations = []
+    for _ in range(BENCHMARK_DRAWS):
+        started = time.perf_counter()
+        panel.draw_waveform()
+        durations.append(time.perf_counter() - started)
+    result.update(timing_stats("draw_waveform", durations))
+
+    # Every tick lands on a new pixel column: the cursor is blitted each time, as in fully zoomed-in playback
+    columns = np.arange(BENCHMARK_TICKS) % panel.plot_width
+    samples = ((columns + 0.5) * source.frames / panel.plot_width).astype(int)
+    durations = []
+    for sample in samples:
+        started = time.perf_counter()
+        panel.update_progress_line(sample)
+        durations.append(time.perf_counter() - started)
+    result.update(timing_stats("progress_line", durations))
+    durations = []
+    for tick, sample in enumerate(samples):
+        started = time.perf_counter()
+        panel.update_led_meter(sample, tick * FRAME_INTERVAL_MS / 1000)
+        durations.append(time.perf_counter() - started)
+    result.update(timing_stats("led_meter", durations))
+
+    # From pressing play to the first block leaving the transport
+    durations = []
+    for _ in range(BENCHMARK_PLAYS):
+        started = time.perf_counter()
+        panel.play_audio()
+        while backend.first_block is None:
+            time.sleep(0.0005)
+        durations.append(backend.first_block - started)
+        panel.stop_audio()
+    result.update(timing_stats("play_start", durations))
+
+    transport.play(panels[0].slot)
+    calls = []
+    for switch in range(BENCHMARK_SWITCHES):
+        started = time.perf_counter()
+        transport.switch(panels[(switch + 1) % 2].slot)
+        calls.append(time.perf_counter() - started)
+        time.sleep(2 * PLAYBACK_BLOCK_FRAMES / source.frame_rate)  # Let the switch become audible
+    transport.stop()
+    result.update(timing_stats("switch_call", calls))
+    result.update(timing_stats("switch", list(transport.switch_latencies)))  # Request to the first switched block
+    result.update(timing_stats("render_block", backend.render_times))
+    backend.close()
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+def run_benchmark(output=None, cases=BENCHMARK_CASES):
+    """Generate test files of growing size, time every stage on each, and write the results as JSON"""
+    with open(os.path.abspath(__file__), "rb") as f:
+        code = hashlib.sha1(f.read()).hexdigest()[:12]
+    report = {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "code_sha1": code, "python": platform.python_version(),
+              "numpy": np.__version__, "platform": platform.platform(), "cpus": os.cpu_count(), "cases": []}
+    folder = tempfile.mkdtemp(prefix="audio-ab-tester-benchmark-")
+    failures = 0
+    try:
+        for number, (seconds, frame_rate, sample_width) in enumerate(cases, 1):
+            path = os.path.join(folder, f"test-{seconds}s-{frame_rate}hz-{8 * sample_width}bit.wav")
+            write_test_wav(path, seconds, frame_rate, sample_width)
+            result = {"seconds": seconds, "frame_rate": frame_rate, "bits": 8 * sample_width,
+                      "channels": BENCHMARK_CHANNELS}
+            # Spawned afresh for every file, so no file's memory or warm caches carry over to the next
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+                try:
+                    result.update(pool.submit(benchmark_case, path).result())
+                    summary = (f"decode {result['decode_ms']:.0f} ms, draw {result['draw_waveform_mean_ms']:.1f} ms, "
+                               f"play {result['play_start_mean_ms']:.1f} ms, switch {result['switch_mean_ms']:.1f} ms, "
+                               f"peak {result['peak_rss_mb']} MB")
+                except Exception as e:
+                    result["error"] = summary = str(e) or type(e).__name__
+                    failures += 1
+            shutil.rmtree(os.path.join(folder, "cache"), ignore_errors=True)
+            os.unlink(path)
+            report["cases"].append(result)
+            print(f"[{number}/{len(cases)}] {seconds} s, {frame_rate} Hz, {8 * sample_width}-bit: {summary}",
+                  file=sys.stderr)
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+    text = json.dumps(report, indent=2) + "\n"
+    if output:
+        with open(output, "w") as f:
+            f.write(text)
+    else:
+        sys.stdout.write(text)
+    return 1 if failures else 0
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Compare audio files side by side.")
+    parser.add_argument("--batch", metavar="MANIFEST",
+                        help="compare the pairs in a CSV manifest (reference,candidate per line) without the GUI")
+    parser.add_argument("--output", metavar="FILE",
+                        help="batch results file; .csv writes CSV, anything else JSON lines (default: stdout)")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="time decoding, drawing, meters, playback start and switching on generated files "
+                             "without the GUI, writing JSON to --output (default: stdout)")
+    parser.add_argument("--jobs", type=int, default=BATCH_WORKERS, help="worker processes for --batch and --scan")
+    parser.add_argument("--playlist", metavar="MANIFEST",
+                        help="step through the pairs in a CSV manifest, preparing the next ones in the background")
+    parser.add_argument("--scan", metavar="FOLDER", action="append",
+                        help="add FOLDER to the library and index its new or changed files without the GUI")
+    parser.add_argument("--ui-stats", action="store_true",
+                        help="print UI tick timing statistics to stderr on exit")
+    parser.add_argument("--sources", type=int, default=SOURCE_COUNT, choices=range(2, MAX_SOURCES + 1),
+                        metavar=f"2-{MAX_SOURCES}", help="number of files to compare side by side")
+    parser.add_argument("--startup-times", action="store_true",
+                        help="print how long each startup phase took to stderr")
+    return parser.parse_args(argv)
+
 def main():
+    args = parse_args()
+    if args.batch:
+        sys.exit(run_batch(args.batch, args.output, args.jobs))
+    if args.scan:
+        sys.exit(run_scan(args.scan, args.jobs))
+    if args.benchmark:
+        sys.exit(run_benchmark(args.output))
+
+    timer = StartupTimer()
+    timer.mark("imports")
+    # matplotlib is the slowest import by far; load it while the window is being built
+    threading.Thread(target=matplotlib_tk, daemon=True).start()
+
     root = tk.Tk()
     root.title("Audio A/B Tester by Hamid Ahang")
     root.geometry("1000x750")
 
     # Setup background
     bg_canvas = setup_background(root)
+    timer.mark("window")
+
+    # Both panels play through one transport so switching keeps the position
+    transport = Transport()
 
     # Panels with updated positions and sizes
-    left_panel = AudioPanel(root if not bg_canvas else bg_canvas, "")
+    left_panel = AudioPanel(root if not bg_canvas else bg_canvas, "A", transport)
     left_panel.frame.place(x=LEFT_PANEL_X, y=LEFT_PANEL_Y)
 
-    right_panel = AudioPanel(root if not bg_canvas else bg_canvas, "")
+    right_panel = AudioPanel(root if not bg_canvas else bg_canvas, "B", transport)
     right_panel.frame.place(x=RIGHT_PANEL_X, y=RIGHT_PANEL_Y)
+    panels = [left_panel, right_panel]
+
+    # Sources beyond A and B share the transport from a window of their own
+    if args.sources > 2:
+        more = tk.Toplevel(root)
+        more.title("More sources")
+        more.configure(bg=COLOR_SCHEME["panel_bg"])
+        more.protocol("WM_DELETE_WINDOW", more.iconify)  # The panels live on; just get it out of the way
+        for index in range(2, args.sources):
+            panel = AudioPanel(more, chr(ord("A") + index), transport)
+            panel.frame.grid(row=(index - 2) // MORE_SOURCES_COLUMNS, column=(index - 2) % MORE_SOURCES_COLUMNS,
+                             padx=5, pady=5)
+            panels.append(panel)
+
+    # The null test subtracts B from A and plays through the slot after the sources, so the next
+    # number key switches to it
+    difference = DifferencePanel(root, root if not bg_canvas else bg_canvas, transport, panels[:2])
+    difference.toggle.place(x=NULL_X, y=NULL_Y)
+
+    abx = AbxPanel(root, root if not bg_canvas else bg_canvas, transport, panels)
+    abx.toggle.place(x=ABX_X, y=ABX_Y)
+
+    library = LibraryPanel(root, root if not bg_canvas else bg_canvas, panels)
+    library.toggle.place(x=LIBRARY_X, y=LIBRARY_Y)
+
+    status = TransportStatus(root if not bg_canvas else bg_canvas, transport,
+                             [p.name for p in panels + [difference, abx]])
+    status.place(x=STATUS_X, y=STATUS_Y, width=STATUS_WIDTH)
+
+    loudness_match = LoudnessMatch(root if not bg_canvas else bg_canvas, transport, panels)
+    loudness_match.place(x=MATCH_X, y=MATCH_Y)
+
+    time_align = TimeAlign(root if not bg_canvas else bg_canvas, transport, panels)
+    time_align.place(x=ALIGN_X, y=ALIGN_Y)
+
+    playlist = PlaylistPanel(root, root if not bg_canvas else bg_canvas, transport, panels, time_align)
+    playlist.toggle.place(x=PLAYLIST_X, y=PLAYLIST_Y)
+    if args.playlist:
+        playlist.open(args.playlist)
+
+    def switch_source(slot=None):
+        try:
+            transport.switch(slot)
+        except ValueError as e:
+            messagebox.showwarning("Switch", f"Can't switch source:\n{e}")
+
+    root.bind(SWITCH_HOTKEY, lambda event: switch_source())
+    for slot in range(min(9, len(panels) + 1)):
+        root.bind(str(slot + 1), lambda event, slot=slot: switch_source(slot))
 
     animated_gif = None # Initialize to None
     # Add animated GIF with updated position to fit in cassette area
@@ -688,15 +4552,35 @@ def main():
         # Store a reference to prevent garbage collection
         root.animated_gif = animated_gif
 
+    timer.mark("widgets")
+
+    # Cursors, meters, the status line and the cassette all redraw from one tick
+    scheduler = FrameScheduler(root, transport)
+    for client in panels + [difference, status, animated_gif, SourcePager(transport)]:
+        if client:
+            scheduler.add(client)
+
     # --- New Cleanup Function ---
     def on_closing():
-        # Stop all audio playback
-        left_panel.stop_audio()
-        right_panel.stop_audio()
+        # Stop all audio playback and abandon any loads in progress
+        for panel in panels:
+            if panel.load_job:
+                panel.cancel_load()
+        difference.close()
+        abx.close()
+        library.close()
+        playlist.close()
+        transport.stop()
+        if transport.backend:
+            transport.backend.close()
+        LOADER_POOL.shutdown(wait=False, cancel_futures=True)
 
         # Stop GIF animation if it exists
         if animated_gif:
             animated_gif.stop()
+        scheduler.stop()
+        if args.ui_stats:
+            print(json.dumps(scheduler.stats()), file=sys.stderr)
 
         # Destroy the main window
         root.destroy()
@@ -704,6 +4588,15 @@ def main():
     # Bind the cleanup function to the window's close protocol
     root.protocol("WM_DELETE_WINDOW", on_closing)
 
+    # Show the window before the plots go in, then build them once matplotlib has loaded
+    root.update()
+    timer.mark("first paint")
+    for panel in panels[:2]:
+        panel.ensure_plot()
+    timer.mark("plots")
+    if args.startup_times:
+        print(json.dumps(timer.report()), file=sys.stderr)
+
     root.mainloop()
 
 